@@ -4,95 +4,150 @@ from __future__ import annotations
 from game_object import GameObject
 from vector import Vector2
 from sprite import Sprite
-from game_map import Map
+from entity_store import EntityStore, EntityField
+from game_map import MapComponents, NeighbourMasks, NEIGHBOUR_PLUS_ROW, NEIGHBOUR_MINUS_ROW, NEIGHBOUR_PLUS_COL, NEIGHBOUR_MINUS_COL
 from utility import magnitude_2d
 # numpy
 import numpy as np
+from numpy_typing import NDArray
+# numba
+import numba
 # standard
-from queue import Queue
-from typing import TYPE_CHECKING, Iterator, Callable
+import heapq
+import math
+from typing import TYPE_CHECKING, Iterator, Iterable, Callable, Union
 import random
 
 if TYPE_CHECKING:
     from game import RaycastingGame
+    from flow_field import FlowField
+    from path_scheduler import PathRequest
 
 
 Point = tuple[int, int]
 
 
-def get_neighbours(position: Point, game_map: Map):
-    neighbours = []
-    # +x
-    if position[0] != game_map.shape[0] - 1 and game_map[position[0] + 1, position[1]] == 0:
-        neighbours.append((position[0] + 1, position[1]))
-    # -x
-    if position[0] != 0 and game_map[position[0] - 1, position[1]] == 0:
-        neighbours.append((position[0] - 1, position[1]))
-    # +y
-    if position[1] != game_map.shape[1] - 1 and game_map[position[0], position[1] + 1] == 0:
-        neighbours.append((position[0], position[1] + 1))
-    # -y
-    if position[1] != 0 and game_map[position[0], position[1] - 1] == 0:
-        neighbours.append((position[0], position[1] - 1))
+@numba.jit(nopython=True, nogil=True, cache=True)
+def a_star_search(start: int, goal: int, masks: NeighbourMasks) -> NDArray[np.int32]:
+    # A* over the map's empty cells using 4-way movement and a Manhattan distance heuristic
+    # cells are identified by their flat index row * width + col
+    # returns the flat indices of the path from start to goal, or an empty array if the goal is inaccessible
+    width = masks.shape[1]
+    flat_masks = masks.ravel()
+    goal_row = goal // width
+    goal_col = goal % width
 
-    return neighbours
+    came_from = np.full(flat_masks.shape[0], -1, dtype=np.int32)
+    g_cost = np.full(flat_masks.shape[0], np.iinfo(np.int32).max, dtype=np.int32)
+    g_cost[start] = 0
+    came_from[start] = start
 
+    # entries are (f cost, heuristic, cell); ties on f are broken towards cells closer to the goal
+    h = abs(start // width - goal_row) + abs(start % width - goal_col)
+    border = [(h, h, start)]
+
+    while len(border) > 0:
+        f, h, current = heapq.heappop(border)
 
-def a_star(start: Point, goal: Point, game_map: Map) -> tuple[bool, list[Point]]:
-    border = Queue()
-    border.put(start)
-    came_from = {start: None}
+        if current == goal:  # path found
+            length = g_cost[goal] + 1
+            path = np.empty(length, dtype=np.int32)
+            # retrace steps in reverse
+            for i in range(length - 1, -1, -1):
+                path[i] = current
+                current = came_from[current]
+            return path
 
-    while not border.empty():
-        current = border.get()
+        if f > g_cost[current] + h:  # stale entry for a cell that has since been reached more cheaply
+            continue
 
-        if current == goal:  # possible path found
-            break
+        cost = g_cost[current] + 1
+        mask = flat_masks[current]
 
-        # for each neighbour of the current cell
-        for neighbour in get_neighbours(current, game_map):
-            if neighbour not in came_from:  # if we haven't already reached the cell
-                border.put(neighbour)  # add cell to the border
-                came_from[neighbour] = current  # add an entry so that we can retrace later
+        for bit, offset in ((NEIGHBOUR_PLUS_ROW, width), (NEIGHBOUR_MINUS_ROW, -width), (NEIGHBOUR_PLUS_COL, 1), (NEIGHBOUR_MINUS_COL, -1)):
+            if not mask & bit:
+                continue
 
-        if border.empty():  # the goal position is inaccessible
-            return False, []
+            neighbour = current + offset
+            if cost >= g_cost[neighbour]:
+                continue
 
-    current = goal
-    path = []
-    # retrace steps in reverse
-    while current != start:
-        path.append(current)
-        current = came_from[current]
-    path.append(start)  # add start position
-    path.reverse()  # reverse path
+            g_cost[neighbour] = cost
+            came_from[neighbour] = current  # add an entry so that we can retrace later
+            neighbour_h = abs(neighbour // width - goal_row) + abs(neighbour % width - goal_col)
+            heapq.heappush(border, (cost + neighbour_h, neighbour_h, neighbour))
 
-    return True, path
+    return np.empty(0, dtype=np.int32)  # the goal position is inaccessible
 
 
-def random_goal(start: Point, game_map: Map) -> list[Point]:
-    border = Queue()
-    border.put(start)
-    came_from = {start: None}
+def in_bounds(point: Point, masks: NeighbourMasks) -> bool:
+    return 0 <= point[0] < masks.shape[0] and 0 <= point[1] < masks.shape[1]
 
-    while not border.empty():
-        current = border.get()
 
-        for neighbour in get_neighbours(current, game_map):
-            if neighbour not in came_from:
-                border.put(neighbour)
-                came_from[neighbour] = current
+def a_star(start: Point, goal: Point, masks: NeighbourMasks) -> tuple[bool, list[Point]]:
+    if not in_bounds(start, masks) or not in_bounds(goal, masks):
+        return False, []
 
-    current = random.choice(list(came_from.keys()))
-    path = []
-    # retrace steps in reverse
-    while current != start:
-        path.append(current)
-        current = came_from[current]
-    path.append(start)  # add start position
-    path.reverse()  # reverse path
+    width = masks.shape[1]
+    path = a_star_search(start[0] * width + start[1], goal[0] * width + goal[1], masks)
 
-    return path
+    if path.shape[0] == 0:
+        return False, []
+
+    return True, [(int(cell) // width, int(cell) % width) for cell in path]
+
+
+def random_goal(start: Point, components: MapComponents) -> list[Point]:
+    # picks a random cell from the region start is in and searches for a path to it
+    # start and the path are in map coordinates, the search runs in the coordinates of the map's window
+    adjacency = components.adjacency
+    local_start = adjacency.point_to_local(start)
+    if not in_bounds(local_start, adjacency.masks):
+        return [start]
+
+    label = components.label(*local_start)
+    if label == -1:  # standing in a wall, nowhere to go
+        return [start]
+
+    goal = components.random_cell(label)
+    accessible, path = a_star(local_start, goal, adjacency.masks)
+    return [adjacency.point_to_world(point) for point in path] if accessible else [start]
+
+
+@numba.jit(nopython=True, cache=True)
+def integrate_movement(position: NDArray[np.float64], goal: NDArray[np.float64], movement: NDArray[np.float64],
+                       speed: NDArray[np.float64], moving: NDArray[np.bool_], size: int, delta_time: float):
+    # moves every moving entity in the first size rows straight towards its goal at its speed
+    for i in range(size):
+        if not moving[i]:
+            continue
+
+        # find position relative to goal
+        relative_x = goal[i, 0] - position[i, 0]
+        relative_y = goal[i, 1] - position[i, 1]
+        distance = math.sqrt(relative_x * relative_x + relative_y * relative_y)
+        if distance == 0:
+            continue
+
+        # direction (the normalised relative position) scaled by speed and delta time
+        step = speed[i] * delta_time / distance
+        movement[i, 0] = relative_x * step
+        movement[i, 1] = relative_y * step
+        position[i, 0] += movement[i, 0]
+        position[i, 1] += movement[i, 1]
+
+
+def move_agents(store: EntityStore, delta_time: float):
+    # the movement step of every agent in the store in one pass
+    size = store.size
+    relative_position = store.goal[:size] - store.position[:size]
+    square_distance = relative_position[:, 0] * relative_position[:, 0] + relative_position[:, 1] * relative_position[:, 1]
+    reached = np.flatnonzero(store.alive[:size] & store.pathfinding[:size] & (square_distance < Agent.min_goal_distance * Agent.min_goal_distance))
+    # only agents that reached a goal this frame need to step their (python) path iterators
+    for i in reached:
+        store.owners[i].advance_path()
+
+    integrate_movement(store.position, store.goal, store.movement, store.speed, store.moving & store.alive, size, delta_time)
 
 
 def vector_to_point(vector: Vector2) -> Point:
@@ -106,23 +161,45 @@ def point_to_centre_vector(point: Point) -> Vector2:
 class Agent(GameObject):
     min_goal_distance: float = 0.3
 
+    goal: Vector2 = EntityField()
+    movement: Vector2 = EntityField()
+    speed: float = EntityField()
+    moving: bool = EntityField()
+    pathfinding: bool = EntityField()
+
     def __init__(self, position: Vector2, sprite: Sprite, game: RaycastingGame, speed: float = 1):
         super().__init__(position, sprite)
-        self.pathfinding: bool = False
-        self.moving: bool = False
-        self.goal: Vector2 = np.zeros((2, ))
+        self.pathfinding = False
+        self.moving = False
+        self.goal = np.zeros((2, ))
         self.path: Iterator[Point] = iter([])
         self.game: RaycastingGame = game
-        self.speed: float = speed
-        self.movement: Vector2 = np.zeros((2, ))
+        self.speed = speed
+        self.movement = np.zeros((2, ))
         self.on_reached_goal: list[Callable] = []
+        self.path_request: Union[PathRequest, None] = None
+
+    @property
+    def path_pending(self) -> bool:
+        return self.path_request is not None
 
-    def follow_path_to(self, goal: Vector2) -> bool:
-        accessible, path = iter(a_star(vector_to_point(self.position), vector_to_point(goal), self.game.map))
+    def request_path(self, search: Callable[[], list[Point]]):
+        # runs search on the game's path scheduler and follows the result once it is ready, keeping the current
+        # behaviour until then
+        if self.path_request is not None:
+            self.path_request.cancel()
+        self.path_request = self.game.path_scheduler.submit(self, search, self.receive_path)
+
+    def receive_path(self, path: list[Point]):
+        self.path_request = None
         self.follow_path(path)
-        return accessible
 
-    def follow_path(self, path: list[Point]):
+    def follow_flow_field(self, flow_field: FlowField) -> bool:
+        start = vector_to_point(self.position)
+        self.follow_path(flow_field.path_from(start))
+        return flow_field.reachable(start)
+
+    def follow_path(self, path: Iterable[Point]):
         self.pathfinding = True
         self.moving = True
         self.path = iter(path)
@@ -148,23 +225,24 @@ class Agent(GameObject):
     def reached_goal(self) -> bool:
         return magnitude_2d(self.goal - self.position) < Agent.min_goal_distance
 
+    def unbind(self, game: RaycastingGame):
+        super().unbind(game)
+        if self.path_request is not None:  # nobody is left to follow the path
+            self.path_request.cancel()
+            self.path_request = None
+
     def random_point(self) -> Point:
-        return random.randint(0, self.game.map.shape[0]), random.randint(0, self.game.map.shape[1])
+        return random.randint(0, self.game.map_data.shape[0]), random.randint(0, self.game.map_data.shape[1])
 
     def movement_relative_to_camera(self):
         return np.matmul(self.game.player.inv_camera_matrix, self.movement)
 
+    def advance_path(self):
+        # called by move_agents when the agent reaches its current goal
+        # if pathfinding move to next goal if there is one
+        if self.pathfinding and not self.next_goal():
+            # if there is no next goal then
+            self.end_path()
+
     def update(self, delta_time: float):
-        if self.reached_goal():
-            # if pathfinding move to next goal if there is one
-            if self.pathfinding and not self.next_goal():
-                # if there is no next goal then
-                self.end_path()
-
-        if self.moving:
-            relative_position = self.goal - self.position  # find position relative to goal
-            direction = relative_position / magnitude_2d(relative_position)  # calculate direction by normalising relative position
-            movement = direction * self.speed * delta_time  # determine movement based on speed and delta time
-
-            self.movement = movement  # set movement
-            self.position += movement  # move
+        pass  # movement is done for every agent at once by move_agents
@@ -0,0 +1,87 @@
+import unittest
+import numpy as np
+from agent import Agent, a_star, random_goal, move_agents
+from entity_store import EntityStore
+from sprite import Sprite
+from game_map import compute_neighbour_masks, MapAdjacency, MapComponents
+
+
+class AStarTest(unittest.TestCase):
+    def setUp(self):
+        self.map = compute_neighbour_masks(np.array([
+            [0, 0, 0, 0],
+            [1, 1, 1, 0],
+            [0, 0, 0, 0],
+            [0, 1, 1, 1],
+        ], dtype=np.uint8))
+
+    def test_path(self):
+        accessible, path = a_star((0, 0), (3, 0), self.map)
+        self.assertTrue(accessible)
+        self.assertEqual(path, [(0, 0), (0, 1), (0, 2), (0, 3), (1, 3), (2, 3), (2, 2), (2, 1), (2, 0), (3, 0)])
+
+    def test_same_cell(self):
+        self.assertEqual(a_star((2, 2), (2, 2), self.map), (True, [(2, 2)]))
+
+    def test_inaccessible(self):
+        self.assertEqual(a_star((0, 0), (3, 3), self.map), (False, []))
+        self.assertEqual(a_star((0, 0), (4, 0), self.map), (False, []))
+
+    def test_shortest(self):
+        game_map = np.zeros((20, 30), dtype=np.uint8)
+        game_map[5, 1:] = 1
+        game_map[12, :-1] = 1
+        accessible, path = a_star((0, 0), (19, 0), compute_neighbour_masks(game_map))
+        self.assertTrue(accessible)
+        self.assertEqual(len(path), 19 + 2 * 29 + 1)
+        for a, b in zip(path, path[1:]):
+            self.assertEqual(abs(a[0] - b[0]) + abs(a[1] - b[1]), 1)
+            self.assertEqual(game_map[b], 0)
+
+
+class RandomGoalTest(unittest.TestCase):
+    def setUp(self):
+        self.map = np.array([
+            [0, 0, 1, 0],
+            [0, 0, 1, 0],
+            [1, 1, 1, 0],
+        ], dtype=np.uint8)
+        self.components = MapComponents(MapAdjacency(self.map))
+
+    def test_stays_in_region(self):
+        for _ in range(20):
+            path = random_goal((0, 0), self.components)
+            self.assertEqual(path[0], (0, 0))
+            self.assertIn(path[-1], [(0, 0), (0, 1), (1, 0), (1, 1)])
+
+    def test_wall(self):
+        self.assertEqual(random_goal((2, 0), self.components), [(2, 0)])
+
+    def test_map_change(self):
+        self.assertFalse(self.components.connected((0, 0), (0, 3)))
+        self.components.adjacency.set_cell(1, 2, 0)
+        self.assertTrue(self.components.connected((0, 0), (0, 3)))
+        self.assertEqual(self.components.size(self.components.label(0, 0)), 8)
+
+
+class MoveAgentsTest(unittest.TestCase):
+    def test_follow_path(self):
+        store = EntityStore()
+        agents = [Agent(np.array([0.5, 0.5]), Sprite(np.array([0.5, 0.5])), None, speed) for speed in (1, 2)]
+        reached = []
+        for agent in agents:
+            store.attach(agent.sprite, agent)
+            agent.on_reached_goal.append(lambda agent=agent: reached.append(agent))
+            agent.follow_path([(0, 0), (0, 1), (2, 1)])
+
+        for _ in range(100):
+            move_agents(store, 0.05)
+
+        self.assertEqual(reached, [agents[1], agents[0]])
+        for agent in agents:
+            self.assertFalse(agent.moving)
+            self.assertLess(np.linalg.norm(agent.position - [1.5, 2.5]), Agent.min_goal_distance)
+
+
+if __name__ == '__main__':
+    unittest.main()
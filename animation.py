@@ -2,12 +2,14 @@ from __future__ import annotations
 
 import pygame.time
 from texture import TextureData
-from data_manager import DataManager
+from data_manager import DataManager, get_textures
+# standard
+from collections.abc import Sequence
 
 
 class Animation:
-    def __init__(self, textures: list[TextureData], framerate: float = 10, looping: bool = True):
-        self.textures: list[TextureData] = textures
+    def __init__(self, textures: Sequence[TextureData], framerate: float = 10, looping: bool = True):
+        self.textures: Sequence[TextureData] = textures
         self.framerate: float = framerate
         self.looping: bool = looping
         self._started: bool = False
@@ -39,4 +41,4 @@ class Animation:
 
     @staticmethod
     def from_textures(data: DataManager, name: str, count: int, start: int = 1) -> Animation:
-        return Animation([data.textures[name + str(i)] for i in range(start, count + 1)])
+        return Animation(get_textures(data, name, count, start))
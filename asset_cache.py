@@ -0,0 +1,176 @@
+# project
+from texture import TextureAtlas, TexturePixels, texture_to_pixels
+# numpy
+import numpy as np
+# pygame
+import pygame
+# standard
+import os
+import json
+import hashlib
+import logging
+import argparse
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Union
+
+
+cache_logger = logging.getLogger("cache")
+
+
+# an on-disk pack of already decoded texture pixels laid out exactly like a TextureAtlas buffer, plus a JSON index
+# describing where each texture lives in it and which version of the source file it was built from
+class TexturePack:
+    VERSION: int = 1
+    PACK_FILENAME: str = "textures.pack"
+    INDEX_FILENAME: str = "textures.json"
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    @staticmethod
+    def read_index(cache_path: str) -> dict[str, dict]:
+        try:
+            with open(os.path.join(cache_path, TexturePack.INDEX_FILENAME)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if index.get("version") != TexturePack.VERSION:
+            return {}
+
+        return index["textures"]
+
+    @staticmethod
+    def is_fresh(entry: dict, path: str, stat: os.stat_result) -> bool:
+        if entry["source"] != os.path.basename(path):
+            return False
+        # an unchanged modification time and size are trusted without hashing the file
+        if entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return True
+        return entry["sha1"] == TexturePack.hash_file(path)
+
+    @staticmethod
+    def decode(path: str) -> tuple[TexturePixels, str]:
+        return texture_to_pixels(pygame.image.load(path)), TexturePack.hash_file(path)
+
+    @staticmethod
+    def build(textures_path: str, cache_path: str, executor: Union[Executor, None] = None) -> int:
+        # (re)builds the pack, decoding only the textures whose source files changed since the last build
+        # stale textures are decoded concurrently on executor if one is given
+        # returns the number of textures that had to be decoded
+        old_index = TexturePack.read_index(cache_path)
+        pack_path = os.path.join(cache_path, TexturePack.PACK_FILENAME)
+        old_pixels: TexturePixels = np.fromfile(pack_path, dtype=np.uint32) if old_index and os.path.exists(pack_path) else np.empty((0, ), dtype=np.uint32)
+
+        files = sorted(os.listdir(textures_path))
+        stats = {file: os.stat(os.path.join(textures_path, file)) for file in files}
+
+        # start decoding every stale texture before assembling the pack
+        decoded: dict[str, Union[Future[tuple[TexturePixels, str]], tuple[TexturePixels, str]]] = {}
+        for file in files:
+            path = os.path.join(textures_path, file)
+            entry = old_index.get(os.path.splitext(file)[0])
+            if entry is not None and entry["offset"] + entry["width"] * entry["height"] <= old_pixels.shape[0] and TexturePack.is_fresh(entry, path, stats[file]):
+                continue
+            decoded[file] = TexturePack.decode(path) if executor is None else executor.submit(TexturePack.decode, path)
+
+        index = {}
+        chunks: list[TexturePixels] = []
+        offset = 0
+
+        for file in files:
+            name = os.path.splitext(file)[0]
+            stat = stats[file]
+
+            if file not in decoded:
+                entry = old_index[name]
+                pixels = old_pixels[entry["offset"]:entry["offset"] + entry["width"] * entry["height"]]
+                width, height = entry["width"], entry["height"]
+                sha1 = entry["sha1"]
+            else:
+                result = decoded[file]
+                texture_pixels, sha1 = result.result() if isinstance(result, Future) else result
+                width, height = texture_pixels.shape
+                pixels = texture_pixels.ravel()
+                cache_logger.info(f"Rebuilt stale texture {name}")
+
+            index[name] = {
+                "source": file,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha1": sha1,
+                "offset": offset,
+                "width": width,
+                "height": height,
+            }
+            chunks.append(pixels)
+            offset += pixels.shape[0]
+
+        os.makedirs(cache_path, exist_ok=True)
+
+        # write to temporary files first so that an interrupted build never leaves a pack that disagrees with its index
+        pixels = np.concatenate(chunks) if chunks else np.empty((0, ), dtype=np.uint32)
+        pixels.tofile(pack_path + ".tmp")
+        with open(os.path.join(cache_path, TexturePack.INDEX_FILENAME + ".tmp"), "w") as f:
+            json.dump({"version": TexturePack.VERSION, "textures": index}, f)
+        os.replace(pack_path + ".tmp", pack_path)
+        os.replace(os.path.join(cache_path, TexturePack.INDEX_FILENAME + ".tmp"), os.path.join(cache_path, TexturePack.INDEX_FILENAME))
+
+        return len(decoded)
+
+    @staticmethod
+    def is_stale(textures_path: str, cache_path: str) -> bool:
+        index = TexturePack.read_index(cache_path)
+        files = os.listdir(textures_path)
+
+        if len(index) != len(files) or not os.path.exists(os.path.join(cache_path, TexturePack.PACK_FILENAME)):
+            return True
+
+        # only compare modification times and sizes here; build decides whether changed files really need decoding
+        for file in files:
+            entry = index.get(os.path.splitext(file)[0])
+            stat = os.stat(os.path.join(textures_path, file))
+            if entry is None or entry["source"] != file or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                return True
+
+        return False
+
+    @staticmethod
+    def load(cache_path: str) -> tuple[TextureAtlas, dict[str, int]]:
+        # memory-maps the pack as the buffer of an atlas, returning it with the atlas index of each texture
+        index = TexturePack.read_index(cache_path)
+        names = sorted(index, key=lambda name: index[name]["offset"])
+
+        pack_path = os.path.join(cache_path, TexturePack.PACK_FILENAME)
+        if os.path.getsize(pack_path) == 0:  # empty files cannot be memory-mapped
+            pixels = np.empty((0, ), dtype=np.uint32)
+        else:
+            pixels = np.memmap(pack_path, dtype=np.uint32, mode="r")
+
+        atlas = TextureAtlas.from_buffer(
+            pixels,
+            np.array([index[name]["offset"] for name in names], dtype=np.int64),
+            np.array([index[name]["width"] for name in names], dtype=np.int64),
+            np.array([index[name]["height"] for name in names], dtype=np.int64),
+        )
+        return atlas, {name: i for i, name in enumerate(names)}
+
+    @staticmethod
+    def load_or_build(textures_path: str, cache_path: str, executor: Union[Executor, None] = None) -> tuple[TextureAtlas, dict[str, int]]:
+        if TexturePack.is_stale(textures_path, cache_path):
+            rebuilt = TexturePack.build(textures_path, cache_path, executor)
+            cache_logger.info(f"Rebuilt texture pack ({rebuilt} textures decoded)")
+        return TexturePack.load(cache_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("textures_path", type=str)
+    parser.add_argument("cache_path", type=str)
+
+    args = parser.parse_args()
+
+    with ThreadPoolExecutor() as executor:
+        print(f"Decoded {TexturePack.build(args.textures_path, args.cache_path, executor)} textures")
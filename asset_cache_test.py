@@ -0,0 +1,53 @@
+import unittest
+import tempfile
+import os
+import numpy as np
+import pygame
+from concurrent.futures import ThreadPoolExecutor
+from asset_cache import TexturePack
+
+
+class TexturePackTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.textures_path = os.path.join(self.directory.name, "textures")
+        self.cache_path = os.path.join(self.directory.name, "cache")
+        os.mkdir(self.textures_path)
+        for name, size, colour in (("a", (2, 3), (255, 0, 0)), ("b", (4, 1), (0, 0, 255))):
+            texture = pygame.Surface(size)
+            texture.fill(colour)
+            pygame.image.save(texture, os.path.join(self.textures_path, name + ".png"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load(self):
+        self.assertTrue(TexturePack.is_stale(self.textures_path, self.cache_path))
+        atlas, indices = TexturePack.load_or_build(self.textures_path, self.cache_path)
+        self.assertFalse(TexturePack.is_stale(self.textures_path, self.cache_path))
+        self.assertIsInstance(atlas.pixels, np.memmap)
+        self.assertEqual(atlas.texture_pixels(indices["a"]).shape, (2, 3))
+        self.assertTrue(np.all(atlas.texture_pixels(indices["a"]) == 0xFFFF0000))
+        self.assertTrue(np.all(atlas.texture_pixels(indices["b"]) == 0xFF0000FF))
+
+    def test_rebuild_stale(self):
+        self.assertEqual(TexturePack.build(self.textures_path, self.cache_path), 2)
+        self.assertEqual(TexturePack.build(self.textures_path, self.cache_path), 0)
+        texture = pygame.Surface((1, 1))
+        texture.fill((0, 255, 0))
+        pygame.image.save(texture, os.path.join(self.textures_path, "b.png"))
+        self.assertEqual(TexturePack.build(self.textures_path, self.cache_path), 1)
+        atlas, indices = TexturePack.load(self.cache_path)
+        self.assertTrue(np.array_equal(atlas.texture_pixels(indices["b"]), [[0xFF00FF00]]))
+        self.assertTrue(np.all(atlas.texture_pixels(indices["a"]) == 0xFFFF0000))
+
+    def test_build_on_executor(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(TexturePack.build(self.textures_path, self.cache_path, executor), 2)
+        atlas, indices = TexturePack.load(self.cache_path)
+        self.assertTrue(np.all(atlas.texture_pixels(indices["a"]) == 0xFFFF0000))
+        self.assertTrue(np.all(atlas.texture_pixels(indices["b"]) == 0xFF0000FF))
+
+
+if __name__ == '__main__':
+    unittest.main()
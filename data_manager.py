@@ -1,10 +1,17 @@
 # project
-from game_map import MapHelper, Map
-from texture import Texture, TextureData
+from game_map import MapHelper, ChunkedMap
+from texture import Texture, TextureData, TextureAtlas, texture_to_pixels, pixels_to_texture
+from asset_cache import TexturePack
 # standard
 import os
 from configparser import ConfigParser
 import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Iterable, Iterator, Union, Callable, TypeVar, Generic
+import time
 # pygame
 import pygame
 from pygame.mixer import Sound
@@ -24,6 +31,10 @@ DEFAULT_CONFIG = {
     "Behaviour": {
         "escape_behaviour": "quit"
     },
+    "Pathfinding": {
+        "frame_budget": 2,  # milliseconds of path searching allowed per frame
+        "workers": 0,  # threads searching for paths in the background (0 searches on the game thread)
+    },
     "Logging": {
         "level": logging.WARNING
     },
@@ -31,31 +42,178 @@ DEFAULT_CONFIG = {
         "fullscreen": True,
         "scaled": True,
         "width": 750,
-        "height": 500
+        "height": 500,
+        "render_scale": 1.0,  # resolution of the 3d view relative to the window
+        "smooth_upscale": False,
+        "dynamic_resolution": False,  # lower the render scale (down to min_render_scale) when frames take too long
+        "target_frame_time": 16.6,  # milliseconds
+        "min_render_scale": 0.25
     }
 }
 
 
+data_logger = logging.getLogger("data")
+
+
+T = TypeVar("T")
+
+
+# decodes assets concurrently on a thread pool, logging how long each one took
+class AssetLoader:
+    def __init__(self, max_workers: Union[int, None] = None):
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asset-loader")
+
+    def submit(self, kind: str, name: str, load: Callable[..., T], *args) -> Future[T]:
+        def timed_load() -> T:
+            start = time.perf_counter()
+            result = load(*args)
+            data_logger.debug(f"Loaded {kind} {name} in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return result
+
+        return self.executor.submit(timed_load)
+
+
+# a mapping from asset name to an asset that is being loaded in the background
+# looking up an asset blocks until that asset (and only that asset) has finished loading
+class AssetMapping(Mapping, Generic[T]):
+    def __init__(self, futures: dict[str, Future[T]]):
+        self.futures: dict[str, Future[T]] = futures
+
+    def __getitem__(self, name: str) -> T:
+        return self.futures[name].result()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.futures)
+
+    def __len__(self) -> int:
+        return len(self.futures)
+
+
+# a mapping from texture name to TextureData that decodes each texture on first access
+# decoded textures (their Surfaces) are kept in a size-bounded LRU; pixels stay in the atlas once packed so that
+# re-decoding an evicted texture does not grow the atlas, so the LRU does not bound the atlas, which holds every
+# texture that has ever been loaded (at most every file in the textures directory, once each)
+class TextureCache(Mapping):
+    DEFAULT_CAPACITY: int = 128
+
+    def __init__(self, path: str, atlas: TextureAtlas, loader: Union[AssetLoader, None] = None, capacity: int = DEFAULT_CAPACITY,
+                 atlas_indices: dict[str, int] = None):
+        self.paths: dict[str, str] = {os.path.splitext(file)[0]: os.path.join(path, file) for file in os.listdir(path)}
+        self.atlas: TextureAtlas = atlas
+        self.capacity: int = capacity
+        self.entries: OrderedDict[str, TextureData] = OrderedDict()
+        if atlas_indices is None:
+            atlas_indices = {}
+        self.atlas_indices: dict[str, int] = atlas_indices  # textures whose pixels are already in the atlas
+        self.lock: threading.Lock = threading.Lock()
+        self.loader: Union[AssetLoader, None] = loader
+
+    def __getitem__(self, name: str) -> TextureData:
+        with self.lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)  # mark as most recently used
+                return self.entries[name]
+            atlas_index = self.atlas_indices.get(name)
+
+        # load outside of the lock so that loads on other threads do not block each other
+        if atlas_index is None:
+            texture = pygame.image.load(self.paths[name])
+            pixels = texture_to_pixels(texture)
+        else:
+            # the pixels are already decoded in the atlas, so skip the image decoder
+            texture = pixels_to_texture(self.atlas.texture_pixels(atlas_index))
+
+        with self.lock:
+            if name in self.entries:  # loaded by another thread in the meantime
+                return self.entries[name]
+
+            if name not in self.atlas_indices:
+                self.atlas_indices[name] = self.atlas.add_pixels(pixels)
+
+            texture_data = TextureData(texture, self.atlas, self.atlas_indices[name])
+            self.entries[name] = texture_data
+
+            while len(self.entries) > self.capacity:
+                evicted, _ = self.entries.popitem(last=False)  # evict least recently used
+                data_logger.debug(f"Evicted texture {evicted}")
+
+        return texture_data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def loaded(self, name: str) -> bool:
+        with self.lock:
+            return name in self.entries
+
+    def prefetch(self, names: Iterable[str]) -> list[Future[TextureData]]:
+        # decode the given textures on background threads
+        if self.loader is None:
+            self.loader = AssetLoader(max_workers=1)
+        return [self.loader.submit("texture", name, self.__getitem__, name) for name in names]
+
+
+# a sequence of textures that are looked up by name in the cache each time they are accessed
+class TextureSequence(Sequence):
+    def __init__(self, textures: Mapping[str, TextureData], names: list[str]):
+        self.textures: Mapping[str, TextureData] = textures
+        self.names: list[str] = names
+
+    def __getitem__(self, index: int) -> TextureData:
+        return self.textures[self.names[index]]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def texture_names(name: str, count: int, start: int = 1) -> list[str]:
+    return [name + str(i) for i in range(start, count + 1)]
+
+
 class DataManager:
-    def __init__(self, textures_path: str, maps_path: str, sounds_path: str, config_path: str):
-        self.textures: dict[str, TextureData] = DataManager.load_textures(textures_path)
-        self.maps: dict[str, Map] = DataManager.load_maps(maps_path)
-        self.sounds: dict[str, Sound] = DataManager.load_sounds(sounds_path)
-        self.config: ConfigParser = DataManager.load_config(config_path)
+    # textures that are needed together, so that they can be decoded in the background before they are first drawn
+    TEXTURE_SETS: dict[str, list[str]] = {
+        "title": texture_names("title", 8) + ["start-button", "quit-button", "again-button"],
+        "hud": texture_names("pistol-shoot", 2) + ["crosshair", "health-bar", "health-strip"],
+        "rat": texture_names("regular-rat", 4) + texture_names("regular-rat-idle", 2),
+        "skeleton": texture_names("rot-skeleton-walk", 8) + texture_names("skeleton-slash", 4),
+    }
+
+    def __init__(self, textures_path: str, maps_path: str, sounds_path: str, config_path: str, config: ConfigParser = None,
+                 texture_cache_path: str = None):
+        if config is None:
+            config = DataManager.load_config(config_path)
+        self.config: ConfigParser = config
+        # assets are loaded concurrently in the background; looking one up waits for it to finish loading
+        self.loader: AssetLoader = AssetLoader()
+        self.maps: AssetMapping[ChunkedMap] = DataManager.load_maps(maps_path, self.loader)
+        self.sounds: AssetMapping[Sound] = DataManager.load_sounds(sounds_path, self.loader)
+        if texture_cache_path is None:
+            self.atlas: TextureAtlas = TextureAtlas()
+            self.textures: TextureCache = TextureCache(textures_path, self.atlas, self.loader)
+        else:
+            # map the prebuilt texture pack, rebuilding any entries whose source files have changed on the loader's threads
+            atlas, atlas_indices = TexturePack.load_or_build(textures_path, texture_cache_path, self.loader.executor)
+            self.atlas: TextureAtlas = atlas
+            self.textures: TextureCache = TextureCache(textures_path, self.atlas, self.loader, atlas_indices=atlas_indices)
+        self.prefetch_textures("title")  # shown as soon as the game starts
         self.sounds_path: str = sounds_path
         self.config_path: str = config_path
 
-    @staticmethod
-    def load_textures(path: str) -> dict[str, TextureData]:
-        return {os.path.splitext(file)[0]: TextureData.from_texture(pygame.image.load(os.path.join(path, file))) for file in os.listdir(path)}
+    def prefetch_textures(self, *set_names: str) -> list[Future[TextureData]]:
+        return self.textures.prefetch([name for set_name in set_names for name in DataManager.TEXTURE_SETS[set_name]])
 
     @staticmethod
-    def load_maps(path: str) -> dict[str, Map]:
-        return {os.path.splitext(file)[0]: MapHelper.load_map_file(os.path.join(path, file)) for file in os.listdir(path)}
+    def load_maps(path: str, loader: AssetLoader) -> AssetMapping[ChunkedMap]:
+        # maps are opened for streaming; only their headers are read up front
+        return AssetMapping({os.path.splitext(file)[0]: loader.submit("map", file, MapHelper.open_map_file, os.path.join(path, file)) for file in os.listdir(path)})
 
     @staticmethod
-    def load_sounds(path: str) -> dict[str, Sound]:
-        return {os.path.splitext(file)[0]: Sound(os.path.join(path, file)) for file in os.listdir(path)}
+    def load_sounds(path: str, loader: AssetLoader) -> AssetMapping[Sound]:
+        return AssetMapping({os.path.splitext(file)[0]: loader.submit("sound", file, Sound, os.path.join(path, file)) for file in os.listdir(path)})
 
     @staticmethod
     def load_config(path: str) -> ConfigParser:
@@ -72,3 +230,7 @@ class DataManager:
 
 def get_sounds(data: DataManager, name: str, count: int, start: int = 1) -> list[Sound]:
     return [data.sounds[name + str(i)] for i in range(start, count + 1)]
+
+
+def get_textures(data: DataManager, name: str, count: int, start: int = 1) -> TextureSequence:
+    return TextureSequence(data.textures, texture_names(name, count, start))
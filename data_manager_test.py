@@ -0,0 +1,37 @@
+import unittest
+from texture import TextureAtlas
+from data_manager import TextureCache, DataManager
+
+
+class TextureCacheTest(unittest.TestCase):
+    def test_eviction(self):
+        atlas = TextureAtlas()
+        cache = TextureCache("textures", atlas, capacity=2)
+        first = cache["coin"]
+        cache["crosshair"]
+        cache["coin"]  # coin is now the most recently used
+        cache["gravestone"]
+        self.assertTrue(cache.loaded("coin"))
+        self.assertFalse(cache.loaded("crosshair"))
+        self.assertIs(cache["coin"], first)
+        # reloading an evicted texture reuses its atlas entry
+        count = atlas.count
+        self.assertEqual(cache["crosshair"].atlas_index, 1)
+        self.assertEqual(atlas.count, count)
+
+    def test_prefetch(self):
+        cache = TextureCache("textures", TextureAtlas())
+        for future in cache.prefetch(["coin", "gravestone"]):
+            future.result()
+        self.assertTrue(cache.loaded("coin"))
+        self.assertTrue(cache.loaded("gravestone"))
+
+    def test_texture_sets(self):
+        cache = TextureCache("textures", TextureAtlas())
+        for names in DataManager.TEXTURE_SETS.values():
+            for name in names:
+                self.assertIn(name, cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 from game import RaycastingGame
 from agent import Agent
+from utility import scale_cache
 import logging
 from typing import Callable
 import pygame
@@ -87,6 +88,7 @@ class RaycastingGameDebugger(Debugger):
             str(target.__self__.game.player.camera_plane),
             str(target.__self__.game.player.forward),
             str(target.__self__.game.player.position),
+            f"scale cache: {scale_cache.hits} hits, {scale_cache.misses} misses, {scale_cache.evictions} evictions, {scale_cache.bytes // 1024} KiB",
             "NOCLIP" if not self.instance.player.clip else ""
         ]
 
@@ -101,7 +103,8 @@ class RaycastingGameDebugger(Debugger):
 
         for obj in self.instance.game_objects:
             if isinstance(obj, Agent) and obj.pathfinding:
-                pygame.draw.circle(surface, (0, 0, 255), (obj.goal[0] * cell_size + centre_offset_x, obj.goal[1] * cell_size), 3)
+                goal = target.__self__.map_data.to_local(obj.goal)
+                pygame.draw.circle(surface, (0, 0, 255), (goal[0] * cell_size + centre_offset_x, goal[1] * cell_size), 3)
 
     def inject(self, instance: RaycastingGame):
         RaycastingGameDebugger.standard_inject(Payload(self.update_payload_before), instance, "update")
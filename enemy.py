@@ -5,14 +5,21 @@ from vector import Vector2
 from sprite import Sprite
 from typing import TYPE_CHECKING
 from game_object import GameObject
+from entity_store import EntityField
 
 if TYPE_CHECKING:
     from game import RaycastingGame
 
 
 class Enemy(Agent):
+    health: float = EntityField()
+    enemy: bool = EntityField()
+    sees_player: bool = EntityField()
+
     def __init__(self, position: Vector2, sprite: Sprite, game: RaycastingGame, max_health: float):
         super().__init__(position, sprite, game)
+        self.enemy = True
+        self.sees_player = False
         self.max_health = max_health
         self.health = max_health
 
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+# numpy
+import numpy as np
+from numpy_typing import NDArray
+# standard
+from typing import Any, Union
+
+
+# the per-entity state of every sprite and game object in the world, kept in contiguous arrays (one row per entity) so
+# that systems can update all of them in a single vectorized pass
+# rows are reused once their entity is detached; alive marks the rows in use
+class EntityStore:
+    FIELDS: tuple[str, ...] = ("position", "goal", "movement", "speed", "health", "moving", "pathfinding", "enemy", "sees_player", "scale", "height_offset")
+
+    def __init__(self, capacity: int = 64):
+        self.position: NDArray[np.float64] = np.zeros((capacity, 2), dtype=np.float64)
+        self.goal: NDArray[np.float64] = np.zeros((capacity, 2), dtype=np.float64)
+        self.movement: NDArray[np.float64] = np.zeros((capacity, 2), dtype=np.float64)
+        self.speed: NDArray[np.float64] = np.zeros((capacity, ), dtype=np.float64)
+        self.health: NDArray[np.float64] = np.zeros((capacity, ), dtype=np.float64)
+        self.moving: NDArray[np.bool_] = np.zeros((capacity, ), dtype=np.bool_)
+        self.pathfinding: NDArray[np.bool_] = np.zeros((capacity, ), dtype=np.bool_)
+        self.enemy: NDArray[np.bool_] = np.zeros((capacity, ), dtype=np.bool_)
+        self.sees_player: NDArray[np.bool_] = np.zeros((capacity, ), dtype=np.bool_)  # updated each frame for enemies
+        self.scale: NDArray[np.float64] = np.ones((capacity, ), dtype=np.float64)
+        self.height_offset: NDArray[np.float64] = np.zeros((capacity, ), dtype=np.float64)
+        self.alive: NDArray[np.bool_] = np.zeros((capacity, ), dtype=np.bool_)
+        self.entities: list[Union[Entity, None]] = [None] * capacity
+        self.owners: list[Any] = [None] * capacity  # the object each row belongs to (e.g. the game object of a sprite)
+        self.free: list[int] = []
+        self.size: int = 0  # one past the highest row ever used
+
+    @property
+    def capacity(self) -> int:
+        return self.alive.shape[0]
+
+    def grow(self, minimum: int):
+        # grow storage geometrically; rows keep their indices so entities stay valid
+        capacity = max(minimum, 2 * self.capacity)
+        for name in EntityStore.FIELDS + ("alive", ):
+            array = getattr(self, name)
+            grown = np.zeros((capacity, ) + array.shape[1:], dtype=array.dtype)
+            grown[:array.shape[0]] = array
+            setattr(self, name, grown)
+        self.entities.extend([None] * (capacity - len(self.entities)))
+        self.owners.extend([None] * (capacity - len(self.owners)))
+
+    def attach(self, entity: Entity, owner: Any = None) -> int:
+        if entity.entity_store is not None:
+            raise ValueError("Entity is already attached to a store")
+
+        if self.free:
+            index = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self.grow(self.size + 1)
+            index = self.size
+            self.size += 1
+
+        for name in EntityStore.FIELDS:
+            getattr(self, name)[index] = 1 if name == "scale" else 0
+        # move the entity's own values into its row
+        for name, value in entity.entity_values.items():
+            getattr(self, name)[index] = value
+        entity.entity_values = {}
+        entity.entity_store = self
+        entity.entity_index = index
+        self.alive[index] = True
+        self.entities[index] = entity
+        self.owners[index] = entity if owner is None else owner
+        return index
+
+    def detach(self, entity: Entity):
+        if entity.entity_store is not self:
+            raise ValueError("Entity is not attached to this store")
+
+        # give the entity copies of its values back so that it still works on its own
+        index = entity.entity_index
+        entity.entity_values = {name: getattr(self, name)[index].copy() for name in EntityStore.FIELDS}
+        entity.entity_store = None
+        entity.entity_index = -1
+        self.alive[index] = False
+        self.entities[index] = None
+        self.owners[index] = None
+        self.free.append(index)
+
+    def indices(self) -> NDArray[np.int64]:
+        return np.flatnonzero(self.alive[:self.size])
+
+
+# an attribute that lives in the entity's row of its store when attached and on the entity itself otherwise
+class EntityField:
+    def __init__(self):
+        self.name: str = ""
+
+    def __set_name__(self, owner: type, name: str):
+        self.name = name
+
+    def __get__(self, entity: Union[Entity, None], owner: Union[type, None] = None) -> Any:
+        if entity is None:
+            return self
+        store = entity.entity_store
+        if store is None:
+            return entity.entity_values[self.name]
+        return getattr(store, self.name)[entity.entity_index]
+
+    def __set__(self, entity: Entity, value: Any):
+        store = entity.entity_store
+        if store is None:
+            entity.entity_values[self.name] = value
+        else:
+            getattr(store, self.name)[entity.entity_index] = value
+
+
+class Entity:
+    def __init__(self):
+        self.entity_store: Union[EntityStore, None] = None
+        self.entity_index: int = -1
+        self.entity_values: dict[str, Any] = {}  # the entity's fields while it isn't attached to a store
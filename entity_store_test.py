@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from entity_store import EntityStore
+from sprite import Sprite
+
+
+class EntityStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = EntityStore(capacity=2)
+
+    def test_attach(self):
+        sprite = Sprite(np.array([1.5, 2.5]), scale=0.5)
+        self.store.attach(sprite)
+        self.assertTrue(np.array_equal(self.store.position[sprite.entity_index], [1.5, 2.5]))
+        # writes through the sprite land in the store
+        sprite.position += 1
+        sprite.height_offset = -0.2
+        self.assertTrue(np.array_equal(self.store.position[sprite.entity_index], [2.5, 3.5]))
+        self.assertEqual(self.store.height_offset[sprite.entity_index], -0.2)
+        self.assertEqual(self.store.scale[sprite.entity_index], 0.5)
+
+    def test_grow(self):
+        sprites = [Sprite(np.array([i, 0], dtype=float)) for i in range(5)]
+        for sprite in sprites:
+            self.store.attach(sprite)
+        self.assertGreaterEqual(self.store.capacity, 5)
+        self.assertEqual([sprite.position[0] for sprite in sprites], list(range(5)))
+        self.assertTrue(np.array_equal(self.store.indices(), np.arange(5)))
+
+    def test_detach(self):
+        a = Sprite(np.array([1, 1], dtype=float))
+        b = Sprite(np.array([2, 2], dtype=float))
+        self.store.attach(a)
+        self.store.attach(b)
+        self.store.detach(a)
+        self.assertIsNone(a.entity_store)
+        self.assertTrue(np.array_equal(a.position, [1, 1]))
+        self.assertTrue(np.array_equal(self.store.indices(), [1]))
+        # the freed row is reused
+        c = Sprite(np.array([3, 3], dtype=float))
+        self.assertEqual(self.store.attach(c), 0)
+        self.assertEqual(c.scale, 1)
+        self.assertRaises(ValueError, self.store.attach, c)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+# project
+from game_map import MapAdjacency, NeighbourMasks, NEIGHBOUR_PLUS_ROW, NEIGHBOUR_MINUS_ROW, NEIGHBOUR_PLUS_COL, NEIGHBOUR_MINUS_COL
+# numpy
+import numpy as np
+from numpy_typing import NDArray
+# numba
+import numba
+# standard
+from typing import Iterator, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from agent import Point
+
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def compute_flow_field(target: int, masks: NeighbourMasks, distance: NDArray[np.int32], next_cell: NDArray[np.int32]):
+    # breadth-first search outward from target over the map's empty cells
+    # fills distance with the number of steps from each cell to target and next_cell with the neighbour to step to in
+    # order to get closer to target (both -1 for cells that can't reach target)
+    width = masks.shape[1]
+    flat_masks = masks.ravel()
+
+    distance[:] = -1
+    next_cell[:] = -1
+
+    queue = np.empty(flat_masks.shape[0], dtype=np.int32)
+    queue[0] = target
+    distance[target] = 0
+    next_cell[target] = target
+    head = 0
+    tail = 1
+
+    while head < tail:
+        current = queue[head]
+        head += 1
+        mask = flat_masks[current]
+
+        for bit, offset in ((NEIGHBOUR_PLUS_ROW, width), (NEIGHBOUR_MINUS_ROW, -width), (NEIGHBOUR_PLUS_COL, 1), (NEIGHBOUR_MINUS_COL, -1)):
+            neighbour = current + offset
+            if not mask & bit or distance[neighbour] != -1:
+                continue
+
+            distance[neighbour] = distance[current] + 1
+            next_cell[neighbour] = current  # step back towards the cell we reached this one from
+            queue[tail] = neighbour
+            tail += 1
+
+
+# a single distance/direction field towards a target cell shared by every agent chasing it
+# the field is only recomputed when the target moves to a different cell or the map changes
+# points passed in and returned are in map coordinates; the field itself covers the map's window
+class FlowField:
+    def __init__(self, adjacency: MapAdjacency):
+        self.adjacency: MapAdjacency = adjacency
+        self.shape: tuple[int, int] = adjacency.masks.shape
+        self.target: Union[Point, None] = None
+        self.revision: int = adjacency.revision
+        self.distance: NDArray[np.int32] = np.full(adjacency.masks.size, -1, dtype=np.int32)
+        self.next_cell: NDArray[np.int32] = np.full(adjacency.masks.size, -1, dtype=np.int32)
+
+    def to_index(self, point: Point) -> int:  # point is in window coordinates
+        return point[0] * self.shape[1] + point[1]
+
+    def to_point(self, index: int) -> Point:
+        return index // self.shape[1], index % self.shape[1]
+
+    def in_bounds(self, point: Point) -> bool:
+        return 0 <= point[0] < self.shape[0] and 0 <= point[1] < self.shape[1]
+
+    def update(self, target: Point):
+        if target == self.target and self.revision == self.adjacency.revision:
+            return
+
+        self.target = target
+        self.revision = self.adjacency.revision
+        local_target = self.adjacency.point_to_local(target)
+        if self.in_bounds(local_target):
+            compute_flow_field(self.to_index(local_target), self.adjacency.masks, self.distance, self.next_cell)
+        else:  # nothing can reach a target outside the map
+            self.distance[:] = -1
+            self.next_cell[:] = -1
+
+    def invalidate(self):
+        # forces the field to be recomputed on the next update (e.g. after the map has changed)
+        self.target = None
+
+    def reachable(self, point: Point) -> bool:
+        local_point = self.adjacency.point_to_local(point)
+        return self.in_bounds(local_point) and self.distance[self.to_index(local_point)] != -1
+
+    def next_step(self, point: Point) -> Union[Point, None]:
+        if not self.reachable(point):
+            return None
+        return self.adjacency.point_to_world(self.to_point(int(self.next_cell[self.to_index(self.adjacency.point_to_local(point))])))
+
+    def path_from(self, start: Point) -> Iterator[Point]:
+        # lazily follows the field from start to the target, reading the field as it is when each step is taken so that
+        # the path keeps up with a moving target
+        if not self.reachable(start):
+            return
+        current = start
+        yield current
+        while True:
+            step = self.next_step(current)
+            if step is None or step == current:
+                return
+            current = step
+            yield current
@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+from flow_field import FlowField
+from game_map import MapAdjacency
+
+
+class FlowFieldTest(unittest.TestCase):
+    def setUp(self):
+        self.map = np.array([
+            [0, 0, 0, 0],
+            [1, 1, 1, 0],
+            [0, 0, 0, 0],
+            [0, 1, 1, 1],
+        ], dtype=np.uint8)
+        self.flow_field = FlowField(MapAdjacency(self.map))
+
+    def test_path(self):
+        self.flow_field.update((3, 0))
+        self.assertEqual(list(self.flow_field.path_from((0, 0))), [(0, 0), (0, 1), (0, 2), (0, 3), (1, 3), (2, 3), (2, 2), (2, 1), (2, 0), (3, 0)])
+        self.assertEqual(self.flow_field.next_step((2, 1)), (2, 0))
+
+    def test_moving_target(self):
+        self.flow_field.update((3, 0))
+        path = self.flow_field.path_from((0, 0))
+        self.assertEqual(next(path), (0, 0))
+        self.flow_field.update((0, 3))
+        self.assertEqual(list(path), [(0, 1), (0, 2), (0, 3)])
+
+    def test_unreachable(self):
+        self.flow_field.update((3, 0))
+        self.assertFalse(self.flow_field.reachable((1, 0)))
+        self.assertEqual(list(self.flow_field.path_from((1, 0))), [])
+        self.flow_field.update((-1, 0))
+        self.assertFalse(self.flow_field.reachable((0, 0)))
+
+    def test_map_change(self):
+        self.flow_field.update((3, 0))
+        self.flow_field.adjacency.set_cell(1, 0, 0)
+        self.flow_field.update((3, 0))
+        self.assertEqual(list(self.flow_field.path_from((0, 0))), [(0, 0), (1, 0), (2, 0), (3, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,17 +5,20 @@ from pygame.time import Clock
 from pygame.surface import Surface
 # numpy
 import numpy as np
+from numpy_typing import NDArray
 # numba
 import numba
 # standard
 import os
 from enum import Enum
 import logging
+import threading
+import time
 # project
 from player import Player
-from game_map import Map
+from game_map import Map, ChunkedMap, MapAdjacency, MapComponents, label_components
 from data_manager import DataManager
-from utility import rotation_matrix
+from utility import rotation_matrix, magnitude_2d, scale_cache
 from vector import Vector2
 from map_renderer import MapRenderer
 from game_renderer import GameRenderer
@@ -26,8 +29,13 @@ from rat import Rat
 from skeleton import Skeleton
 from enemy import Enemy
 from enemy_manager import EnemyManager
+from agent import a_star, vector_to_point, move_agents, integrate_movement
+from flow_field import FlowField, compute_flow_field
+from path_scheduler import PathScheduler
+from entity_store import EntityStore
+from resolution_controller import ResolutionController
 # typing
-from typing import Callable
+from typing import Callable, Union
 
 
 class RaycastInfo:
@@ -39,9 +47,25 @@ class RaycastInfo:
         self.map_position: tuple[int, int] = map_position
 
 
-@numba.jit(nopython=True)
-def raycast(origin_x: float, origin_y: float, direction_x: float, direction_y: float, game_map: Map, distance: float = np.inf):
+class FrameRaycastInfo:
+    def __init__(self, width: int):
+        self.width: int = width
+        self.hit: NDArray[np.bool_] = np.zeros((width, ), dtype=np.bool_)
+        self.perp_wall_dist: NDArray[float] = np.full((width, ), np.inf, dtype=float)
+        self.ns_wall: NDArray[np.bool_] = np.zeros((width, ), dtype=np.bool_)
+        self.map_position: NDArray[np.int32] = np.zeros((width, 2), dtype=np.int32)  # (x, y) of the cell hit by each column
+        self.wall_x: NDArray[float] = np.zeros((width, ), dtype=float)  # where along the wall each column hit, in [0, 1)
+
+
+RAY_HIT: int = 0
+RAY_OUT_OF_RANGE: int = 1
+RAY_OUT_OF_BOUNDS: int = 2
+
+
+@numba.jit(nopython=True, cache=True)
+def march_ray(origin_x: float, origin_y: float, direction_x: float, direction_y: float, game_map: Map, distance: float):
     # from https://lodev.org/cgtutor/raycasting.html
+    # returns (outcome, perp_wall_dist, ns_wall, map_x, map_y) where outcome is one of the RAY_* constants above
 
     map_x = int(origin_x)
     map_y = int(origin_y)
@@ -76,10 +100,10 @@ def raycast(origin_x: float, origin_y: float, direction_x: float, direction_y: f
             ns_wall = False
 
         if ns_wall and side_dist_x - delta_dist_x > distance or not ns_wall and side_dist_y - delta_dist_y > distance:
-            return False, None, None, None, None
+            return RAY_OUT_OF_RANGE, np.inf, ns_wall, map_x, map_y
 
         if map_x < 0 or map_x >= game_map.shape[1] or map_y < 0 or map_y >= game_map.shape[0]:
-            return False, np.inf, (np.inf, np.inf), ns_wall, (map_x, map_y)
+            return RAY_OUT_OF_BOUNDS, np.inf, ns_wall, map_x, map_y
 
         hit = game_map[map_y, map_x] != 0
 
@@ -88,6 +112,19 @@ def raycast(origin_x: float, origin_y: float, direction_x: float, direction_y: f
     else:
         perp_wall_dist = side_dist_y - delta_dist_y
 
+    return RAY_HIT, perp_wall_dist, ns_wall, map_x, map_y
+
+
+@numba.jit(nopython=True, cache=True)
+def raycast(origin_x: float, origin_y: float, direction_x: float, direction_y: float, game_map: Map, distance: float = np.inf):
+    outcome, perp_wall_dist, ns_wall, map_x, map_y = march_ray(origin_x, origin_y, direction_x, direction_y, game_map, distance)
+
+    if outcome == RAY_OUT_OF_RANGE:
+        return False, None, None, None, None
+
+    if outcome == RAY_OUT_OF_BOUNDS:
+        return False, np.inf, (np.inf, np.inf), ns_wall, (map_x, map_y)
+
     return (True,
             perp_wall_dist,
             (origin_x + direction_x * perp_wall_dist, origin_y + direction_y * perp_wall_dist),
@@ -95,6 +132,49 @@ def raycast(origin_x: float, origin_y: float, direction_x: float, direction_y: f
             (map_x, map_y))
 
 
+@numba.jit(nopython=True, cache=True)
+def raycast_frame(origin: Vector2, forward: Vector2, camera_plane: Vector2, width: int, game_map: Map,
+                  hit: NDArray[np.bool_], perp_wall_dist: NDArray[float], ns_wall: NDArray[np.bool_],
+                  map_position: NDArray[np.int32], wall_x: NDArray[float]):
+    # casts one ray per screen column in a single call, writing results into the preallocated output arrays
+    for x in range(width):
+        # how far x is along the screen between -0.5 and 0.5
+        camera_x = x / width - 0.5
+        direction_x = forward[0] + camera_plane[0] * camera_x
+        direction_y = forward[1] + camera_plane[1] * camera_x
+
+        outcome, distance, ns, map_x, map_y = march_ray(origin[0], origin[1], direction_x, direction_y, game_map, np.inf)
+
+        hit[x] = outcome == RAY_HIT
+        perp_wall_dist[x] = distance
+        ns_wall[x] = ns
+        map_position[x, 0] = map_x
+        map_position[x, 1] = map_y
+
+        if outcome == RAY_HIT:
+            # find the point at which the wall was hit
+            collision = origin[1] + direction_y * distance if ns else origin[0] + direction_x * distance
+            wall_x[x] = collision - np.floor(collision)
+        else:
+            wall_x[x] = 0
+
+
+@numba.jit(nopython=True, cache=True)
+def line_of_sight_batch(origins: NDArray[np.float64], target: Vector2, game_map: Map) -> NDArray[np.bool_]:
+    # for each origin, whether target can be seen from it (i.e. no wall is hit before reaching target)
+    # rays that leave the map are blocked, since everything outside it reads as a wall
+    visible = np.ones(origins.shape[0], dtype=np.bool_)
+    for i in range(origins.shape[0]):
+        relative_x = target[0] - origins[i, 0]
+        relative_y = target[1] - origins[i, 1]
+        distance = np.sqrt(relative_x * relative_x + relative_y * relative_y)
+        if distance == 0:
+            continue
+        outcome = march_ray(origins[i, 0], origins[i, 1], relative_x / distance, relative_y / distance, game_map, distance)[0]
+        visible[i] = outcome == RAY_OUT_OF_RANGE
+    return visible
+
+
 game_logger = logging.getLogger("game")
 
 
@@ -122,20 +202,38 @@ class RaycastingGame:
 
         self.clock: Clock = Clock()
         self.running: bool = False
-        self.map: Map = self.data.maps["main"]
+        self.map_data: ChunkedMap = self.data.maps["main"]
+        self.map: Map = self.map_data.cells
         self.player: Player = Player(
             self.data.config,
             self,
-            position=np.array(self.map.shape, dtype=float) / 1.5,
+            position=np.array(self.map_data.shape, dtype=float) / 1.5,
         )
+        self.map_data.load_around(self.player.position)
+        # shared by every enemy chasing the player
+        self.adjacency: MapAdjacency = self.map_data.adjacency
+        self.components: MapComponents = MapComponents(self.adjacency)
+        self.flow_field: FlowField = FlowField(self.adjacency)
+        self.path_scheduler: PathScheduler = PathScheduler(
+            self.data.config.getfloat("Pathfinding", "frame_budget") / 1000,
+            lambda: self.player.position,
+            self.adjacency,
+            self.data.config.getint("Pathfinding", "workers"),
+        )
+        self.entities: EntityStore = EntityStore()
         self.sprites: list[Sprite] = []
         self.game_objects: list[GameObject] = []
         self.enemies: list[Enemy] = []
+        self.frame_info: FrameRaycastInfo = FrameRaycastInfo(0)
+        self.warmup_thread: Union[threading.Thread, None] = None
+        # decode what the game needs once it starts while the title screen is up
+        self.data.prefetch_textures("hud", "rat", "skeleton")
         Rat(np.array([5.5, 5.5], dtype=float), self).bind(self)
         Rat(np.array([2.5, 2.5], dtype=float), self).bind(self)
         Rat(np.array([11.5, 14.5], dtype=float), self).bind(self)
-        self.map_renderer: MapRenderer = MapRenderer(self.map, self.player, self.sprites)
+        self.map_renderer: MapRenderer = MapRenderer(self.map_data, self.player, self.sprites)
         self.game_renderer: GameRenderer = GameRenderer(self, self.data.textures["dusk-sky"].texture)
+        self.resolution_controller: Union[ResolutionController, None] = self.create_resolution_controller()
         self.ui_renderer: UIRenderer = UIRenderer(self)
         self.enemy_manager: EnemyManager = self.create_enemy_manager()
         self.game_mode: RaycastingGame.GameMode = RaycastingGame.GameMode.UI
@@ -169,26 +267,73 @@ class RaycastingGame:
                 Skeleton(empty_position, self)
             ]
         ]
-        spawn_locations = [
-            np.array([2.5, 2.5], dtype=float),
-            np.array([9.5, 1.5], dtype=float),
-            np.array([13.5, 3.5], dtype=float),
-            np.array([2.5, 13.5], dtype=float),
-            np.array([11.5, 14.5], dtype=float),
-        ]
+        if self.map_data.spawn_points:
+            spawn_locations = [np.array(spawn_point, dtype=float) for spawn_point in self.map_data.spawn_points]
+        else:
+            spawn_locations = [
+                np.array([2.5, 2.5], dtype=float),
+                np.array([9.5, 1.5], dtype=float),
+                np.array([13.5, 3.5], dtype=float),
+                np.array([2.5, 13.5], dtype=float),
+                np.array([11.5, 14.5], dtype=float),
+            ]
         for location in spawn_locations:
-            self.sprites.append(Sprite(location, [self.data.textures["gravestone"]], height_offset=-0.2))
+            self.add_sprite(Sprite(location, [self.data.textures["gravestone"]], height_offset=-0.2))
         return EnemyManager(self, spawn_locations, waves)
 
+    def create_resolution_controller(self) -> Union[ResolutionController, None]:
+        video_config = self.data.config["Video"]
+        if not video_config.getboolean("dynamic_resolution"):
+            return None
+        return ResolutionController(
+            video_config.getfloat("target_frame_time") / 1000,
+            video_config.getfloat("min_render_scale"),
+            self.game_renderer.render_scale,  # never go above the configured scale
+        )
+
+    def add_sprite(self, sprite: Sprite, owner: Union[GameObject, None] = None):
+        self.entities.attach(sprite, owner)
+        self.sprites.append(sprite)
+
+    def remove_sprite(self, sprite: Sprite):
+        self.entities.detach(sprite)
+        self.sprites.remove(sprite)
+
+    def warmup(self, surface: Surface):
+        # call every numba kernel once with the argument types used in game so that they are compiled (or loaded from
+        # numba's on-disk cache) before the player clicks start rather than on the first frame
+        start = time.perf_counter()
+        origin = self.map_data.to_local(self.player.position)
+        raycast(origin[0], origin[1], self.player.forward[0], self.player.forward[1], self.map)
+        raycast(origin[0], origin[1], self.player.forward[0], self.player.forward[1], self.map, magnitude_2d(origin))
+        info = FrameRaycastInfo(1)
+        raycast_frame(origin, self.player.forward, self.player.camera_plane, info.width, self.map,
+                      info.hit, info.perp_wall_dist, info.ns_wall, info.map_position, info.wall_x)
+        a_star(vector_to_point(origin), vector_to_point(origin), self.adjacency.masks)
+        label_components(self.map, self.adjacency.masks)
+        line_of_sight_batch(self.entities.position[:1], origin, self.map)
+        integrate_movement(self.entities.position, self.entities.goal, self.entities.movement, self.entities.speed,
+                           self.entities.moving, 0, 0.0)
+        field = FlowField(self.adjacency)
+        compute_flow_field(0, self.adjacency.masks, field.distance, field.next_cell)
+        self.game_renderer.warmup(surface)
+        game_logger.info(f"Kernel warmup took {(time.perf_counter() - start) * 1000:.1f} ms")
+
     def start_game(self):
+        # don't start until the kernels are ready
+        if self.warmup_thread is not None:
+            self.warmup_thread.join()
         self.player: Player = Player(
             self.data.config,
             self,
-            position=np.array(self.map.shape, dtype=float) / 1.5,
+            position=np.array(self.map_data.shape, dtype=float) / 1.5,
         )
+        self.map_data.load_around(self.player.position)  # the previous run may have left the window elsewhere
+        self.entities: EntityStore = EntityStore()
         self.sprites: list[Sprite] = []
         self.game_objects: list[GameObject] = []
         self.enemies: list[Enemy] = []
+        self.path_scheduler.clear()
         Rat(np.array([5.5, 5.5], dtype=float), self).bind(self)
         Rat(np.array([2.5, 2.5], dtype=float), self).bind(self)
         Rat(np.array([11.5, 14.5], dtype=float), self).bind(self)
@@ -246,18 +391,48 @@ class RaycastingGame:
                     self.ui_renderer.handle_click()
 
     def resize(self, size):
+        scale_cache.clear()  # nothing will be drawn at the old sizes again
         self.game_renderer.resize(size)
         self.ui_renderer.resize(size)
 
     def raycast(self, origin: Vector2, direction: Vector2, distance: float = np.inf) -> RaycastInfo:
-        return RaycastInfo(*raycast(origin[0], origin[1], direction[0], direction[1], self.map, distance))
+        # cast through the map's window and move the results back into map coordinates
+        local_origin = self.map_data.to_local(origin)
+        info = RaycastInfo(*raycast(local_origin[0], local_origin[1], direction[0], direction[1], self.map, distance))
+        if info.collision is not None:
+            offset = origin - local_origin
+            info.collision = np.array(info.collision) + offset
+            info.map_position = (int(info.map_position[0] + offset[0]), int(info.map_position[1] + offset[1]))
+        return info
+
+    def raycast_frame(self, width: int) -> FrameRaycastInfo:
+        # reuse the previous frame's buffers unless the number of columns has changed
+        if self.frame_info.width != width:
+            self.frame_info = FrameRaycastInfo(width)
+
+        info = self.frame_info
+        # map positions are of cells in the map's window
+        raycast_frame(self.map_data.to_local(self.player.position), self.player.forward, self.player.camera_plane, width, self.map,
+                      info.hit, info.perp_wall_dist, info.ns_wall, info.map_position, info.wall_x)
+        return info
+
+    def update_line_of_sight(self):
+        # which enemies can see the player this frame, for every enemy at once
+        store = self.entities
+        rows = np.flatnonzero(store.alive[:store.size] & store.enemy[:store.size])
+        store.sees_player[rows] = line_of_sight_batch(self.map_data.to_local(store.position[rows]), self.map_data.to_local(self.player.position), self.map)
 
     def update_game(self, delta_time: float):
         self.process_game_events(pygame.event.get())
         self.player.update(delta_time)
+        self.map_data.load_around(self.player.position)
+        self.flow_field.update(vector_to_point(self.player.position))
         self.enemy_manager.update(delta_time)
+        move_agents(self.entities, delta_time)
+        self.update_line_of_sight()
         for obj in self.game_objects:
             obj.update(delta_time)
+        self.path_scheduler.update()
 
     def update_ui(self, delta_time: float):
         self.process_ui_events(pygame.event.get())
@@ -303,6 +478,10 @@ class RaycastingGame:
 
         self.game_mode_ui()
 
+        # compile kernels in the background while the title screen is showing
+        self.warmup_thread = threading.Thread(target=self.warmup, args=(window, ), daemon=True)
+        self.warmup_thread.start()
+
         self.enemy_manager.start()
 
         pygame.mixer.music.load(os.path.join(self.data.sounds_path, self.MUSIC_FILENAME))
@@ -310,5 +489,16 @@ class RaycastingGame:
 
         while self.running:
             self.update(self.clock.tick() / 1000)
+            draw_start = time.perf_counter()
             self.draw(window)
+            draw_time = time.perf_counter() - draw_start
             pygame.display.flip()
+
+            # only change the render scale between frames, and only while the 3d view is being drawn
+            if self.resolution_controller is not None and self.draw_mode == RaycastingGame.DrawMode.GAME:
+                scale = self.resolution_controller.update(draw_time, self.game_renderer.render_scale)
+                if scale != self.game_renderer.render_scale:
+                    game_logger.debug(f"Render scale changed to {scale:.2f}")
+                    self.game_renderer.set_render_scale(scale)
+
+        self.path_scheduler.shutdown()
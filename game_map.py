@@ -1,14 +1,25 @@
+from __future__ import annotations
+
+# project
+from vector import Vector2
 # numpy
 import numpy as np
+# numba
+import numba
 # standard
 from enum import IntEnum
+import random
 import struct
+import threading
+import zlib
+from collections import OrderedDict
 # typing
-from typing import BinaryIO
+from typing import BinaryIO, Union
 from numpy_typing import NDArray
 
 
 Map = NDArray[np.uint8]
+SpawnPoint = tuple[float, float]
 
 
 class MapCell(IntEnum):
@@ -16,33 +27,427 @@ class MapCell(IntEnum):
     WALL = 1
 
 
+class MapLayer(IntEnum):
+    CELLS = 0
+    FLOOR = 1  # floor texture ids
+    CEILING = 2  # ceiling texture ids
+
+
+# bits of a cell's neighbour mask that are set when the neighbour in that direction is empty
+NEIGHBOUR_PLUS_ROW: int = 1
+NEIGHBOUR_MINUS_ROW: int = 2
+NEIGHBOUR_PLUS_COL: int = 4
+NEIGHBOUR_MINUS_COL: int = 8
+
+NeighbourMasks = NDArray[np.uint8]
+
+
+def compute_neighbour_masks(game_map: Map) -> NeighbourMasks:
+    empty = (game_map == MapCell.EMPTY).astype(np.uint8)
+    masks = np.zeros(game_map.shape, dtype=np.uint8)
+    masks[:-1, :] |= empty[1:, :] * np.uint8(NEIGHBOUR_PLUS_ROW)
+    masks[1:, :] |= empty[:-1, :] * np.uint8(NEIGHBOUR_MINUS_ROW)
+    masks[:, :-1] |= empty[:, 1:] * np.uint8(NEIGHBOUR_PLUS_COL)
+    masks[:, 1:] |= empty[:, :-1] * np.uint8(NEIGHBOUR_MINUS_COL)
+    return masks
+
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def flood_fill(start: int, masks: NeighbourMasks) -> NDArray[np.bool_]:
+    # returns which cells (by flat index) can be reached from start by walking through empty cells
+    width = masks.shape[1]
+    flat_masks = masks.ravel()
+    reached = np.zeros(flat_masks.shape[0], dtype=np.bool_)
+    stack = np.empty(flat_masks.shape[0], dtype=np.int32)
+    stack[0] = start
+    reached[start] = True
+    size = 1
+
+    while size > 0:
+        size -= 1
+        current = stack[size]
+        mask = flat_masks[current]
+        for bit, offset in ((NEIGHBOUR_PLUS_ROW, width), (NEIGHBOUR_MINUS_ROW, -width), (NEIGHBOUR_PLUS_COL, 1), (NEIGHBOUR_MINUS_COL, -1)):
+            neighbour = current + offset
+            if mask & bit and not reached[neighbour]:
+                reached[neighbour] = True
+                stack[size] = neighbour
+                size += 1
+
+    return reached
+
+
+# which neighbours of each cell can be walked to, kept in step with the map it describes
+# every change to the map must go through set_cell or update_region so that the masks stay valid
+class MapAdjacency:
+    def __init__(self, game_map: Map):
+        self.map: Map = game_map
+        self.masks: NeighbourMasks = compute_neighbour_masks(game_map)
+        self.revision: int = 0  # incremented whenever the map changes
+        self.origin: tuple[int, int] = (0, 0)  # (row, col) of the first cell when the map is a window onto a larger one
+
+    def set_cell(self, row: int, col: int, value: int):
+        self.map[row, col] = value
+        self.update_region(row, row + 1, col, col + 1)
+
+    def update_region(self, row_start: int, row_end: int, col_start: int, col_end: int):
+        # recompute the masks of the changed cells and their neighbours from a window that also includes the
+        # neighbours' neighbours
+        rows, cols = self.map.shape
+        row_start, row_end = max(row_start - 1, 0), min(row_end + 1, rows)
+        col_start, col_end = max(col_start - 1, 0), min(col_end + 1, cols)
+        window_row, window_col = max(row_start - 1, 0), max(col_start - 1, 0)
+        window = compute_neighbour_masks(self.map[window_row:min(row_end + 1, rows), window_col:min(col_end + 1, cols)])
+        self.masks[row_start:row_end, col_start:col_end] = window[row_start - window_row:row_end - window_row, col_start - window_col:col_end - window_col]
+        self.revision += 1
+
+    def reset(self):
+        self.masks = compute_neighbour_masks(self.map)
+        self.revision += 1
+
+    def point_to_local(self, point: tuple[int, int]) -> tuple[int, int]:
+        return point[0] - self.origin[0], point[1] - self.origin[1]
+
+    def point_to_world(self, point: tuple[int, int]) -> tuple[int, int]:
+        return point[0] + self.origin[0], point[1] + self.origin[1]
+
+    def walkable(self, path: list[tuple[int, int]]) -> bool:
+        # whether every cell of a path (in map coordinates) is empty and inside the map
+        if not path:
+            return True
+        cells = np.array(path) - np.array(self.origin)
+        rows, cols = cells[:, 0], cells[:, 1]
+        if np.any((rows < 0) | (rows >= self.map.shape[0]) | (cols < 0) | (cols >= self.map.shape[1])):
+            return False
+        return not self.map[rows, cols].any()
+
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def label_components(game_map: Map, masks: NeighbourMasks) -> tuple[NDArray[np.int32], int]:
+    # labels every empty cell (by flat index) with the connected region of empty cells it belongs to; walls are -1
+    # returns the labels and the number of regions
+    width = masks.shape[1]
+    flat_map = game_map.ravel()
+    flat_masks = masks.ravel()
+    labels = np.full(flat_map.shape[0], -1, dtype=np.int32)
+    stack = np.empty(flat_map.shape[0], dtype=np.int32)
+    count = 0
+
+    for seed in range(flat_map.shape[0]):
+        if flat_map[seed] != 0 or labels[seed] != -1:
+            continue
+
+        labels[seed] = count
+        stack[0] = seed
+        size = 1
+        while size > 0:
+            size -= 1
+            current = stack[size]
+            mask = flat_masks[current]
+            for bit, offset in ((NEIGHBOUR_PLUS_ROW, width), (NEIGHBOUR_MINUS_ROW, -width), (NEIGHBOUR_PLUS_COL, 1), (NEIGHBOUR_MINUS_COL, -1)):
+                neighbour = current + offset
+                if mask & bit and labels[neighbour] == -1:
+                    labels[neighbour] = count
+                    stack[size] = neighbour
+                    size += 1
+        count += 1
+
+    return labels, count
+
+
+# the connected regions of empty cells of a map, with the cells of each region stored contiguously so that a random
+# cell of any region can be picked in constant time
+# rebuilt lazily the first time it is used after the map changes
+class MapComponents:
+    def __init__(self, adjacency: MapAdjacency):
+        self.adjacency: MapAdjacency = adjacency
+        self.revision: int = -1
+        self.labels: NDArray[np.int32] = np.empty((0, ), dtype=np.int32)
+        # the cells of region i are cells[starts[i]:starts[i + 1]]
+        self.cells: NDArray[np.int32] = np.empty((0, ), dtype=np.int32)
+        self.starts: NDArray[np.int64] = np.zeros((1, ), dtype=np.int64)
+        self.lock: threading.Lock = threading.Lock()  # random goals may be picked on pathfinding worker threads
+
+    def update(self):
+        with self.lock:
+            if self.revision == self.adjacency.revision:
+                return
+
+            revision = self.adjacency.revision  # read first so that a change made while labelling is picked up next time
+            labels, count = label_components(self.adjacency.map, self.adjacency.masks)
+            empty = np.flatnonzero(labels != -1).astype(np.int32)
+            starts = np.zeros((count + 1, ), dtype=np.int64)
+            starts[1:] = np.cumsum(np.bincount(labels[empty], minlength=count))
+            # replace the arrays in one go so that readers on other threads never see a mix of old and new
+            self.labels, self.cells, self.starts = labels, empty[np.argsort(labels[empty], kind="stable")], starts
+            self.revision = revision
+
+    def label(self, row: int, col: int) -> int:
+        self.update()
+        return int(self.labels[row * self.adjacency.map.shape[1] + col])
+
+    def size(self, label: int) -> int:
+        self.update()
+        return int(self.starts[label + 1] - self.starts[label])
+
+    def connected(self, a: tuple[int, int], b: tuple[int, int]) -> bool:
+        label = self.label(*a)
+        return label != -1 and label == self.label(*b)
+
+    def random_cell(self, label: int) -> tuple[int, int]:
+        self.update()
+        cell = int(self.cells[random.randrange(self.starts[label], self.starts[label + 1])])
+        return cell // self.adjacency.map.shape[1], cell % self.adjacency.map.shape[1]
+
+
+# a map stored in square chunks that are only decompressed when they are needed
+# only a window of chunks around the player is resident, in dense arrays that the game reads directly; everything
+# outside the window (and past the edge of the map) reads as a wall, so nothing can be seen or walked through there
+# the window's cells are in window coordinates, its first cell being origin in map coordinates
+# decompressed chunks are kept in an LRU so that the window can move back over them without decompressing them again
+class ChunkedMap:
+    WINDOW_RADIUS: int = 2  # chunks around the centre chunk of the window
+    CACHE_CAPACITY: int = 64  # decompressed chunks kept in memory (at least a window's worth)
+
+    def __init__(self, shape: tuple[int, int], chunk_size: int, layers: list[MapLayer], spawn_points: list[SpawnPoint],
+                 stream: Union[BinaryIO, None] = None, index: Union[NDArray[np.uint64], None] = None,
+                 window_radius: int = WINDOW_RADIUS, cache_capacity: int = CACHE_CAPACITY):
+        self.shape: tuple[int, int] = shape
+        self.chunk_size: int = chunk_size
+        self.chunk_shape: tuple[int, int] = (-(-shape[0] // chunk_size), -(-shape[1] // chunk_size))  # ceiling division
+        self.window_radius: int = window_radius
+        self.window_chunks: tuple[int, int] = (min(2 * window_radius + 1, self.chunk_shape[0]), min(2 * window_radius + 1, self.chunk_shape[1]))
+        window_shape = (min(self.window_chunks[0] * chunk_size, shape[0]), min(self.window_chunks[1] * chunk_size, shape[1]))
+        self.layers: dict[MapLayer, Map] = {layer: ChunkedMap.empty_layer(layer, window_shape) for layer in layers}
+        self.spawn_points: list[SpawnPoint] = spawn_points
+        self.stream: Union[BinaryIO, None] = stream
+        # (offset, length) of each compressed chunk indexed [layer, chunk row, chunk col]
+        self.index: Union[NDArray[np.uint64], None] = index
+        self.window: Union[tuple[int, int], None] = None  # the first chunk of the window, None until it is loaded
+        self.cache_capacity: int = cache_capacity
+        # every layer of recently used chunks, indexed [layer, row, col]
+        self.chunks: OrderedDict[tuple[int, int], NDArray[np.uint8]] = OrderedDict()
+        self.adjacency: Union[MapAdjacency, None] = MapAdjacency(self.layers[MapLayer.CELLS]) if MapLayer.CELLS in self.layers else None
+
+    @staticmethod
+    def empty_layer(layer: MapLayer, shape: tuple[int, int]) -> Map:
+        return np.full(shape, MapCell.WALL if layer == MapLayer.CELLS else 0, dtype=np.uint8)
+
+    @property
+    def cells(self) -> Map:
+        return self.layers[MapLayer.CELLS]
+
+    @property
+    def origin(self) -> tuple[int, int]:
+        # (row, col) of the window's first cell
+        return self.adjacency.origin
+
+    def to_local(self, position: Vector2) -> Vector2:
+        # converts (x, y) map positions (or an array of them) into window coordinates
+        return position - np.array([self.origin[1], self.origin[0]], dtype=float)
+
+    def chunk_slices(self, chunk_row: int, chunk_col: int) -> tuple[slice, slice]:
+        return (slice(chunk_row * self.chunk_size, min((chunk_row + 1) * self.chunk_size, self.shape[0])),
+                slice(chunk_col * self.chunk_size, min((chunk_col + 1) * self.chunk_size, self.shape[1])))
+
+    def read_chunk(self, chunk_row: int, chunk_col: int) -> NDArray[np.uint8]:
+        chunk = self.chunks.get((chunk_row, chunk_col))
+        if chunk is not None:
+            self.chunks.move_to_end((chunk_row, chunk_col))
+            return chunk
+
+        rows, cols = self.chunk_slices(chunk_row, chunk_col)
+        chunk = np.empty((len(self.layers), rows.stop - rows.start, cols.stop - cols.start), dtype=np.uint8)
+        for layer_index in range(len(self.layers)):
+            offset, length = self.index[layer_index, chunk_row, chunk_col]
+            self.stream.seek(int(offset))
+            data = zlib.decompress(self.stream.read(int(length)))
+            if len(data) != chunk[layer_index].size:
+                raise ValueError(f"Map chunk ({chunk_row}, {chunk_col}) is corrupt.")
+            chunk[layer_index] = np.frombuffer(data, dtype=np.uint8).reshape(chunk.shape[1:])
+
+        self.chunks[(chunk_row, chunk_col)] = chunk
+        while len(self.chunks) > self.cache_capacity:
+            self.chunks.popitem(last=False)  # evict least recently used
+        return chunk
+
+    def move_window(self, chunk_row: int, chunk_col: int):
+        for layer, cells in self.layers.items():
+            cells[:] = MapCell.WALL if layer == MapLayer.CELLS else 0
+
+        for row in range(chunk_row, chunk_row + self.window_chunks[0]):
+            for col in range(chunk_col, chunk_col + self.window_chunks[1]):
+                chunk = self.read_chunk(row, col)
+                local_row = (row - chunk_row) * self.chunk_size
+                local_col = (col - chunk_col) * self.chunk_size
+                for layer_index, cells in enumerate(self.layers.values()):
+                    cells[local_row:local_row + chunk.shape[1], local_col:local_col + chunk.shape[2]] = chunk[layer_index]
+
+        self.window = (chunk_row, chunk_col)
+        # every cell has moved, so the whole adjacency is rebuilt (which also invalidates everything derived from it)
+        self.adjacency.origin = (chunk_row * self.chunk_size, chunk_col * self.chunk_size)
+        self.adjacency.reset()
+
+    def load_around(self, position: Vector2):
+        # moves the window so that it is centred on the chunk containing position (an (x, y) vector) where the edges
+        # of the map allow it
+        centre_row = int(position[1]) // self.chunk_size
+        centre_col = int(position[0]) // self.chunk_size
+        window = (min(max(centre_row - self.window_radius, 0), self.chunk_shape[0] - self.window_chunks[0]),
+                  min(max(centre_col - self.window_radius, 0), self.chunk_shape[1] - self.window_chunks[1]))
+        if window != self.window:
+            self.move_window(*window)
+
+    def read_layer(self, layer: MapLayer) -> Map:
+        # decompresses a whole layer regardless of the window (for tools that work on the entire map)
+        layer_index = list(self.layers).index(layer)
+        cells = np.zeros(self.shape, dtype=np.uint8)
+        for chunk_row in range(self.chunk_shape[0]):
+            for chunk_col in range(self.chunk_shape[1]):
+                cells[self.chunk_slices(chunk_row, chunk_col)] = self.read_chunk(chunk_row, chunk_col)[layer_index]
+        return cells
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    @staticmethod
+    def from_map(game_map: Map, spawn_points: list[SpawnPoint] = None) -> ChunkedMap:
+        # wraps a fully loaded map as a single chunk that is always in the window
+        chunked_map = ChunkedMap(game_map.shape, max(max(game_map.shape), 1), [], [] if spawn_points is None else spawn_points)
+        chunked_map.layers[MapLayer.CELLS] = game_map
+        chunked_map.adjacency = MapAdjacency(game_map)
+        chunked_map.window = (0, 0)
+        return chunked_map
+
+
 class MapHelper:
+    HEADER_FORMAT: str = "!HH"
+    # version 2: magic, version, height, width, chunk size, layer count
+    MAGIC: bytes = b"NMAP"
+    VERSION: int = 2
+    V2_HEADER_FORMAT: str = "!4sBIIHB"
+    SPAWN_POINT_FORMAT: str = "!ff"
+    CHUNK_INDEX_FORMAT: str = "!QI"
+    DEFAULT_CHUNK_SIZE: int = 32
+
     @staticmethod
     def generate_random_map(shape) -> Map:
         # TODO: replace with something that actually generates a map
         return np.empty(shape, dtype=np.bool_).astype(np.uint8)  # placeholder
 
+    @staticmethod
+    def read_exactly(stream: BinaryIO, size: int, what: str) -> bytes:
+        data = stream.read(size)
+        if len(data) != size:
+            raise ValueError(f"{what} is truncated (expected {size} bytes, got {len(data)}).")
+        return data
+
     @staticmethod
     def load_map(stream: BinaryIO) -> Map:
-        shape = struct.unpack("!HH", stream.read(4))  # load map dimensions as two unsigned shorts
-        arr = np.empty(shape, dtype=np.uint8)
-        for row in range(shape[0]):
-            for col in range(shape[1]):
-                arr[row, col] = struct.unpack("!B", stream.read(1))[0]
-        return arr
+        header = stream.read(struct.calcsize(MapHelper.HEADER_FORMAT))
+        if header == MapHelper.MAGIC:
+            return MapHelper.open_chunked_map(stream, header).read_layer(MapLayer.CELLS)
+
+        if len(header) != struct.calcsize(MapHelper.HEADER_FORMAT):
+            raise ValueError(f"Map header is truncated ({len(header)} bytes).")
+        shape = struct.unpack(MapHelper.HEADER_FORMAT, header)  # load map dimensions as two unsigned shorts
+
+        # read the whole payload in one go into a writable buffer that numpy can wrap without copying
+        payload = bytearray(shape[0] * shape[1])
+        read = stream.readinto(payload)
+        if read != len(payload):
+            raise ValueError(f"Map data is truncated (expected {len(payload)} bytes, got {read}).")
+
+        return np.frombuffer(payload, dtype=np.uint8).reshape(shape)
+
+    @staticmethod
+    def open_chunked_map(stream: BinaryIO, magic: bytes = b"", window_radius: int = ChunkedMap.WINDOW_RADIUS) -> ChunkedMap:
+        # reads the header, spawn points and chunk index of a version 2 map, leaving the chunks in the stream
+        # magic is the part of the header that has already been read from the stream
+        header_size = struct.calcsize(MapHelper.V2_HEADER_FORMAT)
+        header = magic + MapHelper.read_exactly(stream, header_size - len(magic), "Map header")
+        _, version, height, width, chunk_size, layer_count = struct.unpack(MapHelper.V2_HEADER_FORMAT, header)
+        if version != MapHelper.VERSION:
+            raise ValueError(f"Unsupported map version {version}.")
+
+        layers = [MapLayer(layer) for layer in MapHelper.read_exactly(stream, layer_count, "Map layer table")]
+        if MapLayer.CELLS not in layers:
+            raise ValueError("Map has no cell layer.")
+
+        spawn_count, = struct.unpack("!I", MapHelper.read_exactly(stream, 4, "Map spawn points"))
+        spawn_size = struct.calcsize(MapHelper.SPAWN_POINT_FORMAT)
+        spawn_data = MapHelper.read_exactly(stream, spawn_count * spawn_size, "Map spawn points")
+        spawn_points = [struct.unpack_from(MapHelper.SPAWN_POINT_FORMAT, spawn_data, i * spawn_size) for i in range(spawn_count)]
+
+        chunked_map = ChunkedMap((height, width), chunk_size, layers, spawn_points, stream, window_radius=window_radius)
+
+        index_size = layer_count * chunked_map.chunk_shape[0] * chunked_map.chunk_shape[1]
+        index_data = MapHelper.read_exactly(stream, index_size * struct.calcsize(MapHelper.CHUNK_INDEX_FORMAT), "Map chunk index")
+        index = np.array(list(struct.iter_unpack(MapHelper.CHUNK_INDEX_FORMAT, index_data)), dtype=np.uint64)
+        chunked_map.index = index.reshape((layer_count, *chunked_map.chunk_shape, 2))
+
+        return chunked_map
 
     @staticmethod
     def save_map(stream: BinaryIO, game_map: Map):
-        stream.write(struct.pack("!HH", *game_map.shape))  # write dimensions as two unsigned shorts
+        stream.write(struct.pack(MapHelper.HEADER_FORMAT, *game_map.shape))  # write dimensions as two unsigned shorts
         stream.write(game_map.tobytes())  # dump map contents
 
+    @staticmethod
+    def save_chunked_map(stream: BinaryIO, layers: dict[MapLayer, Map], spawn_points: list[SpawnPoint] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if spawn_points is None:
+            spawn_points = []
+        shape = layers[MapLayer.CELLS].shape
+        layout = ChunkedMap(shape, chunk_size, [], [])
+
+        stream.write(struct.pack(MapHelper.V2_HEADER_FORMAT, MapHelper.MAGIC, MapHelper.VERSION, shape[0], shape[1], chunk_size, len(layers)))
+        stream.write(bytes(layers.keys()))
+        stream.write(struct.pack("!I", len(spawn_points)))
+        for spawn_point in spawn_points:
+            stream.write(struct.pack(MapHelper.SPAWN_POINT_FORMAT, *spawn_point))
+
+        # compress every chunk up front so that the index can be written before the chunks
+        chunks = [zlib.compress(np.ascontiguousarray(layer[layout.chunk_slices(chunk_row, chunk_col)]).tobytes())
+                  for layer in layers.values()
+                  for chunk_row in range(layout.chunk_shape[0])
+                  for chunk_col in range(layout.chunk_shape[1])]
+
+        offset = stream.tell() + len(chunks) * struct.calcsize(MapHelper.CHUNK_INDEX_FORMAT)
+        for chunk in chunks:
+            stream.write(struct.pack(MapHelper.CHUNK_INDEX_FORMAT, offset, len(chunk)))
+            offset += len(chunk)
+        for chunk in chunks:
+            stream.write(chunk)
+
     @staticmethod
     def load_map_file(path: str) -> Map:
         with open(path, "rb") as f:
             tmp = MapHelper.load_map(f)
         return tmp
 
+    @staticmethod
+    def open_map_file(path: str) -> ChunkedMap:
+        # opens a map for streaming; legacy version 1 maps are loaded in full
+        f = open(path, "rb")
+        if f.read(len(MapHelper.MAGIC)) == MapHelper.MAGIC:
+            try:
+                return MapHelper.open_chunked_map(f, MapHelper.MAGIC)
+            except ValueError:
+                f.close()  # the map keeps the file open for streaming only once it has been opened successfully
+                raise
+
+        f.seek(0)
+        with f:
+            return ChunkedMap.from_map(MapHelper.load_map(f))
+
     @staticmethod
     def save_map_file(path: str, game_map: Map):
         with open(path, "wb") as f:
             MapHelper.save_map(f, game_map)
+
+    @staticmethod
+    def save_chunked_map_file(path: str, layers: dict[MapLayer, Map], spawn_points: list[SpawnPoint] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        with open(path, "wb") as f:
+            MapHelper.save_chunked_map(f, layers, spawn_points, chunk_size)
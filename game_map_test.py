@@ -1,7 +1,7 @@
 import unittest
 import numpy as np
 import io
-from game_map import MapHelper
+from game_map import MapHelper, MapLayer, MapCell, MapAdjacency, compute_neighbour_masks
 
 
 class MapHelperTest(unittest.TestCase):
@@ -10,6 +10,60 @@ class MapHelperTest(unittest.TestCase):
         actual = np.arange(16, dtype=np.uint8).reshape((4, 4))
         self.assertTrue(np.array_equal(loaded_map, actual))
 
+    def test_load_truncated(self):
+        with self.assertRaises(ValueError):
+            MapHelper.load_map(io.BytesIO(bytes([0, 4])))
+        with self.assertRaises(ValueError):
+            MapHelper.load_map(io.BytesIO(bytes([0, 2, 0, 2, 0, 1, 2])))
+
+    def test_round_trip(self):
+        game_map = np.random.randint(0, 256, (3, 5), dtype=np.uint8)
+        stream = io.BytesIO()
+        MapHelper.save_map(stream, game_map)
+        stream.seek(0)
+        loaded_map = MapHelper.load_map(stream)
+        self.assertTrue(np.array_equal(loaded_map, game_map))
+        self.assertTrue(loaded_map.flags.writeable)
+
+    def test_chunked_round_trip(self):
+        cells = np.random.randint(0, 2, (70, 40), dtype=np.uint8)
+        floor = np.random.randint(0, 256, (70, 40), dtype=np.uint8)
+        stream = io.BytesIO()
+        MapHelper.save_chunked_map(stream, {MapLayer.CELLS: cells, MapLayer.FLOOR: floor}, [(1.5, 2.5)], chunk_size=16)
+
+        stream.seek(0)
+        self.assertTrue(np.array_equal(MapHelper.load_map(stream), cells))
+
+        stream.seek(0)
+        chunked_map = MapHelper.open_chunked_map(stream, window_radius=1)
+        self.assertEqual(chunked_map.spawn_points, [(1.5, 2.5)])
+        self.assertEqual(chunked_map.chunk_shape, (5, 3))
+        # only the chunks around (x=20, y=40) are resident
+        chunked_map.load_around(np.array([20, 40]))
+        self.assertEqual(chunked_map.origin, (16, 0))
+        self.assertTrue(np.array_equal(chunked_map.cells, cells[16:64]))
+        self.assertTrue(np.array_equal(chunked_map.layers[MapLayer.FLOOR], floor[16:64]))
+        self.assertTrue(np.array_equal(chunked_map.to_local(np.array([20.5, 40.5])), [20.5, 24.5]))
+        # the window stops at the edge of the map, and cells past the edge are walls
+        chunked_map.load_around(np.array([20, 69]))
+        self.assertEqual(chunked_map.origin, (32, 0))
+        self.assertTrue(np.array_equal(chunked_map.cells[:38], cells[32:]))
+        self.assertTrue(np.all(chunked_map.cells[38:] == MapCell.WALL))
+        self.assertTrue(np.array_equal(chunked_map.adjacency.masks, compute_neighbour_masks(chunked_map.cells)))
+
+    def test_chunk_eviction(self):
+        cells = np.random.randint(0, 2, (64, 64), dtype=np.uint8)
+        stream = io.BytesIO()
+        MapHelper.save_chunked_map(stream, {MapLayer.CELLS: cells}, chunk_size=8)
+        stream.seek(0)
+        chunked_map = MapHelper.open_chunked_map(stream, window_radius=1)
+        chunked_map.cache_capacity = 12
+        for x in range(0, 64, 8):
+            chunked_map.load_around(np.array([x, x]))
+            self.assertLessEqual(len(chunked_map.chunks), 12)
+            row, col = chunked_map.origin
+            self.assertTrue(np.array_equal(chunked_map.cells, cells[row:row + 24, col:col + 24]))
+
     def test_save(self):
         destination_stream = io.BytesIO()
         MapHelper.save_map(destination_stream, np.arange(9, dtype=np.uint8).reshape((3, 3)))
@@ -17,5 +71,16 @@ class MapHelperTest(unittest.TestCase):
         self.assertEqual(destination_stream.getvalue(), actual)
 
 
+class MapAdjacencyTest(unittest.TestCase):
+    def test_set_cell(self):
+        rng = np.random.default_rng(0)
+        adjacency = MapAdjacency((rng.random((12, 9)) < 0.3).astype(np.uint8))
+        for _ in range(50):
+            adjacency.set_cell(rng.integers(12), rng.integers(9), rng.integers(2))
+            # incremental updates must agree with rebuilding the whole table
+            self.assertTrue(np.array_equal(adjacency.masks, compute_neighbour_masks(adjacency.map)))
+        self.assertEqual(adjacency.revision, 50)
+
+
 if __name__ == '__main__':
     unittest.main()
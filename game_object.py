@@ -2,37 +2,44 @@ from __future__ import annotations
 
 # standard
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Union
 # project
 from sprite import Sprite
 from vector import Vector2
+from entity_store import EntityStore, EntityField
 
 if TYPE_CHECKING:
     from game import RaycastingGame
 
 
+# a game object shares its sprite's row of the game's entity store, so the object's position is the sprite's position
 class GameObject(ABC):
+    position: Vector2 = EntityField()
+
     def __init__(self, position: Vector2, sprite: Sprite):
         self.sprite = sprite
         self.position = position
 
     @property
-    def position(self) -> Vector2:
-        return self._position
+    def entity_store(self) -> Union[EntityStore, None]:
+        return self.sprite.entity_store
+
+    @property
+    def entity_index(self) -> int:
+        return self.sprite.entity_index
 
-    @position.setter
-    def position(self, value):
-        self._position = value
-        self.sprite.position = self._position
+    @property
+    def entity_values(self) -> dict[str, Any]:
+        return self.sprite.entity_values
 
     def bind(self, game: RaycastingGame) -> GameObject:
         game.game_objects.append(self)
-        game.sprites.append(self.sprite)
+        game.add_sprite(self.sprite, self)
         return self
 
     def unbind(self, game: RaycastingGame):
         game.game_objects.remove(self)
-        game.sprites.remove(self.sprite)
+        game.remove_sprite(self.sprite)
 
     @abstractmethod
     def update(self, delta_time: float):
@@ -7,21 +7,140 @@ from pygame.freetype import SysFont
 # numpy
 import numpy as np
 from numpy_typing import NDArray
+# numba
+import numba
 # project
-from game_map import MapCell
+from game_map import MapCell, MapLayer, Map
 from data_manager import Texture
-from sprite import Sprite
+from texture import TextureData
+from vector import Vector2
 from colour import ColourType
 from health_bar import HealthBar
-from utility import scale_by_height
+from utility import scale_by_height, scale_cache
 # standard
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Union
 import math
 
 if TYPE_CHECKING:
     from game import RaycastingGame
 
 
+@numba.jit(nopython=True, cache=True)
+def draw_wall_columns(pixels: NDArray[np.uint32], hit: NDArray[np.bool_], perp_wall_dist: NDArray[float],
+                      map_position: NDArray[np.int32], wall_x: NDArray[float], game_map: Map,
+                      atlas_pixels: NDArray[np.uint32], atlas_offsets: NDArray[np.int64], atlas_widths: NDArray[np.int64],
+                      atlas_heights: NDArray[np.int64], texture_index: NDArray[np.int32], distance_bound: float):
+    # writes a textured wall column into a pixels2d view of the screen for every column that hit a wall
+    surface_height = pixels.shape[1]
+
+    for x in range(pixels.shape[0]):
+        if not hit[x]:
+            continue
+
+        # determine line height, clamping to surface height if the wall distance is very low
+        if perp_wall_dist[x] <= distance_bound:
+            line_height = surface_height
+        else:
+            line_height = int(surface_height / perp_wall_dist[x])
+
+        if line_height <= 0:
+            continue
+
+        # get the wall's texture from the cell the ray hit and slice the column the ray hit out of the atlas
+        texture = texture_index[game_map[map_position[x, 1], map_position[x, 0]]]
+        texture_width = atlas_widths[texture]
+        texture_height = atlas_heights[texture]
+        texture_x = min(int(wall_x[x] * texture_width), texture_width - 1)
+        column_start = atlas_offsets[texture] + texture_x * texture_height
+
+        centre_offset_y = (surface_height - line_height) // 2
+
+        # only visit the rows of the line that are on screen
+        for y in range(max(centre_offset_y, 0), min(centre_offset_y + line_height, surface_height)):
+            pixels[x, y] = atlas_pixels[column_start + (y - centre_offset_y) * texture_height // line_height]
+
+
+@numba.jit(nopython=True, cache=True)
+def draw_plane_rows(pixels: NDArray[np.uint32], origin: Vector2, forward: Vector2, camera_plane: Vector2,
+                    texture_ids: Map, atlas_pixels: NDArray[np.uint32], atlas_offsets: NDArray[np.int64],
+                    atlas_widths: NDArray[np.int64], atlas_heights: NDArray[np.int64],
+                    texture_index: NDArray[np.int32], fill_colour: int, ceiling: bool):
+    # floor (or ceiling) casting, from https://lodev.org/cgtutor/raycasting2.html
+    # every row below the horizon is a line across the floor at a fixed distance, so the world position under each
+    # pixel of the row is found by stepping linearly from the left end of the line to the right
+    # cells whose texture id has no texture (index -1) are filled with fill_colour, or left alone if it is negative
+    width = pixels.shape[0]
+    height = pixels.shape[1]
+    rows = texture_ids.shape[0]
+    cols = texture_ids.shape[1]
+
+    # directions of the rays through the leftmost and rightmost columns (see raycast_frame)
+    left_x = forward[0] - camera_plane[0] * 0.5
+    left_y = forward[1] - camera_plane[1] * 0.5
+    right_x = forward[0] + camera_plane[0] * 0.5
+    right_y = forward[1] + camera_plane[1] * 0.5
+
+    for y in range((height + 1) // 2, height):
+        # distance to the floor under this row for a camera half way between floor and ceiling
+        row_distance = 0.5 * height / (y + 0.5 - 0.5 * height)
+        step_x = row_distance * (right_x - left_x) / width
+        step_y = row_distance * (right_y - left_y) / width
+        floor_x = origin[0] + row_distance * left_x
+        floor_y = origin[1] + row_distance * left_y
+        screen_y = height - 1 - y if ceiling else y
+
+        for x in range(width):
+            cell_x = int(np.floor(floor_x))
+            cell_y = int(np.floor(floor_y))
+
+            texture = -1
+            if 0 <= cell_x < cols and 0 <= cell_y < rows:
+                texture = texture_index[texture_ids[cell_y, cell_x]]
+
+            if texture >= 0:
+                texture_width = atlas_widths[texture]
+                texture_height = atlas_heights[texture]
+                texture_x = min(int((floor_x - cell_x) * texture_width), texture_width - 1)
+                texture_y = min(int((floor_y - cell_y) * texture_height), texture_height - 1)
+                pixels[x, screen_y] = atlas_pixels[atlas_offsets[texture] + texture_x * texture_height + texture_y]
+            elif fill_colour >= 0:
+                pixels[x, screen_y] = fill_colour
+
+            floor_x += step_x
+            floor_y += step_y
+
+
+@numba.jit(nopython=True, cache=True)
+def draw_sprite_columns(pixels: NDArray[np.uint32], z_buffer: NDArray[float], atlas_pixels: NDArray[np.uint32],
+                        atlas_opaque: NDArray[np.bool_], offset: int, texture_width: int, texture_height: int,
+                        flip_x: bool, screen_x: float, screen_y: int, sprite_width: int, sprite_height: int,
+                        depth: float, depth_test: bool):
+    # writes the opaque texels of a sprite scaled to sprite_width x sprite_height into a pixels2d view of the screen,
+    # skipping columns that are off screen or (with depth_test) behind a wall
+    surface_width = pixels.shape[0]
+    surface_height = pixels.shape[1]
+
+    for x in range(sprite_width):
+        column_screen_x = int(screen_x + x)
+        if column_screen_x < 0:
+            continue
+        if column_screen_x >= surface_width:
+            break
+        if depth_test and depth >= z_buffer[column_screen_x]:
+            continue
+
+        texture_x = int(x / sprite_width * texture_width)
+        if flip_x and texture_x != 0:
+            texture_x = texture_width - texture_x
+        column_start = offset + texture_x * texture_height
+
+        # only visit the rows of the column that are on screen
+        for y in range(max(-screen_y, 0), min(surface_height - screen_y, sprite_height)):
+            texel = column_start + y * texture_height // sprite_height
+            if atlas_opaque[texel]:
+                pixels[column_screen_x, screen_y + y] = atlas_pixels[texel]
+
+
 class GameRenderer:
     RAY_DISTANCE_BOUND: float = 0.01
     FONT_SCALE_RATIO: float = 0.05
@@ -33,12 +152,27 @@ class GameRenderer:
     WEAPON_Y_OFFSET: float = -WEAPON_PARABOLA_COEFFICIENT**WEAPON_PARABOLA_EXPONENT
     CROSSHAIR_NAME: str = "crosshair"
     CROSSHAIR_SCALE: float = 0.05
+    SPRITE_MAX_ASPECT: float = 2  # widest width to height ratio of any sprite texture, used when culling
+    # textures for the ids in the map's floor and ceiling layers (0 is a plain floor and open sky)
+    FLOOR_TEXTURES: dict[int, str] = {1: "mossy_cobblestone"}
+    CEILING_TEXTURES: dict[int, str] = {1: "mossy_cobblestone"}
 
     def __init__(self, game: RaycastingGame, sky_texture: Texture):
         self.game: RaycastingGame = game
-        self.texture_map: dict[MapCell, list[Texture]] = {
-            MapCell.WALL: self.game.data.textures["mossy_cobblestone"].columns
+        self.texture_map: dict[MapCell, TextureData] = {
+            MapCell.WALL: self.game.data.textures["mossy_cobblestone"]
         }
+        # atlas index of the texture for each map cell value
+        # every non-empty cell is solid to the raycaster, so cells without a texture of their own are drawn as walls
+        self.wall_texture_index: NDArray[np.int32] = np.full((256, ), self.texture_map[MapCell.WALL].atlas_index, dtype=np.int32)
+        for cell, texture_data in self.texture_map.items():
+            self.wall_texture_index[cell] = texture_data.atlas_index
+        # atlas index of the texture for each floor and ceiling texture id (-1 for none)
+        self.floor_texture_index: NDArray[np.int32] = self.texture_index(GameRenderer.FLOOR_TEXTURES)
+        self.ceiling_texture_index: NDArray[np.int32] = self.texture_index(GameRenderer.CEILING_TEXTURES)
+        # the texture atlas in the screen's pixel format and which of its pixels are opaque (built on first draw)
+        self.atlas_pixels: Union[NDArray[np.uint32], None] = None
+        self.atlas_opaque: NDArray[np.bool_] = np.empty((0, ), dtype=np.bool_)
         self.z_buffer: [NDArray[float]] = np.empty((0, ))
         self.floor_colour: ColourType = (75, 105, 47)
         self.sky_texture: Texture = sky_texture
@@ -50,85 +184,133 @@ class GameRenderer:
         self.font: SysFont = SysFont(GameRenderer.FONT_NAME, 0)
         self.health_bar: HealthBar = HealthBar(self.game.data)
         self.crosshair_texture: Texture = game.data.textures[GameRenderer.CROSSHAIR_NAME].texture
+        video_config = game.data.config["Video"]
+        self.render_scale: float = video_config.getfloat("render_scale")
+        self.smooth_upscale: bool = video_config.getboolean("smooth_upscale")
+        self.size: tuple[int, int] = (0, 0)
+        self.render_size: tuple[int, int] = (0, 0)
+        # offscreen buffer the 3d view is drawn into when render_scale isn't 1 (built on first draw)
+        self.view_surface: Union[Surface, None] = None
+
+    def texture_index(self, textures: dict[int, str]) -> NDArray[np.int32]:
+        index = np.full((256, ), -1, dtype=np.int32)
+        for texture_id, name in textures.items():
+            index[texture_id] = self.game.data.textures[name].atlas_index
+        return index
 
     def resize(self, size):
-        self.z_buffer = np.empty((size[0], ))
+        # the screen's pixel format may have changed
+        self.atlas_pixels = None
+
+        self.size = size
+        self.resize_view()
+
+        # font
+        self.font: SysFont = SysFont(GameRenderer.FONT_NAME, int(size[1] * GameRenderer.FONT_SCALE_RATIO))
+
+        # health bar
+        self.health_bar.resize(size)
+
+    def resize_view(self):
+        # rebuilds everything drawn at the resolution of the 3d view, which is drawn at render_size and upscaled to
+        # size (the view buffer is rebuilt on the next draw)
+        size = self.size
+        self.render_size = (max(int(size[0] * self.render_scale), 1), max(int(size[1] * self.render_scale), 1))
+        self.view_surface = None
+        render_size = self.render_size
 
         # resize light surface
         old_colour = (0, 0, 0) if self.light_surface.get_width() == 0 or self.light_surface.get_height() == 0 else self.light_surface.get_at((0, 0))
         old_alpha = self.light_surface.get_alpha()
-        self.light_surface = Surface(size)
+        self.light_surface = Surface(render_size)
         self.light_surface.fill(old_colour)
         self.light_surface.set_alpha(old_alpha)
 
         old_alpha = self.light_surface.get_alpha()
-        self.hit_surface = Surface(size)
+        self.hit_surface = Surface(render_size)
         self.hit_surface.set_alpha(old_alpha)
         self.hit_surface.fill((255, 0, 0))
 
         # scale sky texture
-        texture_height = size[1] // 2
+        texture_height = render_size[1] // 2
         texture_width = texture_height * self.sky_texture.get_width() // self.sky_texture.get_height()
-        if texture_width < size[0]:  # width is too small
-            texture_width = size[0]
+        if texture_width < render_size[0]:  # width is too small
+            texture_width = render_size[0]
             texture_height = texture_width * self.sky_texture.get_height() // self.sky_texture.get_width()
 
         self.scaled_sky = pygame.transform.scale(self.sky_texture, (texture_width, texture_height))
 
-        # font
-        self.font: SysFont = SysFont(GameRenderer.FONT_NAME, int(size[1] * GameRenderer.FONT_SCALE_RATIO))
-
-        # health bar
-        self.health_bar.resize(size)
+    def warmup(self, surface: Surface):
+        # compiles the rendering kernels for the pixel layout of surface without touching it (it may be in use)
+        scratch = Surface(surface.get_size(), 0, surface)
+        atlas = self.game.data.atlas
+        info = self.game.raycast_frame(scratch.get_width())
+        pixels = pygame.surfarray.pixels2d(scratch)
+        draw_wall_columns(pixels, np.zeros_like(info.hit), info.perp_wall_dist, info.map_position, info.wall_x, self.game.map,
+                          atlas.mapped(scratch), atlas.offsets, atlas.widths, atlas.heights, self.wall_texture_index,
+                          GameRenderer.RAY_DISTANCE_BOUND)
+        draw_plane_rows(pixels, self.game.map_data.to_local(self.game.player.position), self.game.player.forward, self.game.player.camera_plane,
+                        self.game.map, atlas.mapped(scratch), atlas.offsets, atlas.widths, atlas.heights,
+                        self.floor_texture_index, scratch.map_rgb(self.floor_colour), False)
+        draw_sprite_columns(pixels, info.perp_wall_dist, atlas.mapped(scratch), atlas.opaque(), atlas.offsets[0], 1, 1,
+                            False, 0.0, 0, 0, 0, 1.0, True)
+        del pixels
+
+    def update_atlas_pixels(self, surface: Surface):
+        atlas = self.game.data.atlas
+        if self.atlas_pixels is None or self.atlas_pixels.shape[0] != atlas.size:  # textures were loaded since mapping
+            self.atlas_pixels = atlas.mapped(surface)
+            self.atlas_opaque = atlas.opaque()[:self.atlas_pixels.shape[0]]
 
     def draw_walls(self, surface: Surface):
-        for x in range(surface.get_width()):
-            # how far x is along the screen between -0.5 and 0.5
-            camera_x = x / surface.get_width() - 0.5
-            # raycast
-            info = self.game.raycast(self.game.player.position, self.game.player.forward + self.game.player.camera_plane * camera_x)
-
-            # store hit distance into z-buffer
-            self.z_buffer[x] = info.perp_wall_dist
-
-            if info.hit:
-                # determine line height, clamping to surface height if the wall distance is very low to avoid running
-                # out of memory when scaling the texture
-                line_height = surface.get_height() if info.perp_wall_dist <= GameRenderer.RAY_DISTANCE_BOUND else int(surface.get_height() / info.perp_wall_dist)
-
-                # find the point at which the wall was hit
-                wall_x = info.collision[1] if info.ns_wall else info.collision[0]
-                wall_x -= np.floor(wall_x)
-
-                # get the wall's texture columns from the texture map
-                texture = self.texture_map[self.game.map[info.map_position[1], info.map_position[0]]]
-
-                # find the index of the texture column the ray hit
-                texture_x = int(wall_x * len(texture))
-
-                centre_offset_y = (surface.get_height() - line_height) / 2
-
-                scaled_texture = pygame.transform.scale(texture[texture_x], (1, line_height))
-
-                # blit scaled texture column to screen
-                surface.blit(scaled_texture, (x, centre_offset_y))
+        atlas = self.game.data.atlas
+        self.update_atlas_pixels(surface)
+
+        # raycast every column of the screen at once
+        info = self.game.raycast_frame(surface.get_width())
+
+        # the hit distances double as the z-buffer
+        self.z_buffer = info.perp_wall_dist
+
+        # write wall texels directly into the screen (the surface stays locked until the view is released)
+        pixels = pygame.surfarray.pixels2d(surface)
+        draw_wall_columns(pixels, info.hit, info.perp_wall_dist, info.map_position, info.wall_x, self.game.map,
+                          self.atlas_pixels, atlas.offsets, atlas.widths, atlas.heights, self.wall_texture_index,
+                          GameRenderer.RAY_DISTANCE_BOUND)
+        del pixels
+
+    def project_sprites(self, surface: Surface) -> tuple[NDArray[np.int64], NDArray[np.float64]]:
+        # projects every sprite into camera space at once, returning the rows of the entity store that may be on
+        # screen ordered furthest first along with their camera space positions
+        store = self.game.entities
+        rows = store.indices()
+        transformed = (store.position[rows] - self.game.player.position) @ self.game.player.inv_camera_matrix.T
+        depth = transformed[:, 1]
+
+        # cull sprites behind the camera, then sprites whose widest possible extent is off either side of the screen
+        in_front = depth > 0
+        rows, transformed, depth = rows[in_front], transformed[in_front], depth[in_front]
+        screen_x = surface.get_width() / 2 * (1 + transformed[:, 0] / depth * 2)
+        half_width = surface.get_height() * store.scale[rows] / depth * GameRenderer.SPRITE_MAX_ASPECT / 2
+        on_screen = (screen_x + half_width >= 0) & (screen_x - half_width < surface.get_width())
+        rows, transformed = rows[on_screen], transformed[on_screen]
+
+        order = np.argsort(-transformed[:, 1], kind="stable")
+        return rows[order], transformed[order]
 
     def draw_sprites(self, surface: Surface):
-        def square_distance(sprite: Sprite):
-            relative_position = sprite.position - self.game.player.position
-            return relative_position[0] * relative_position[0] + relative_position[1] * relative_position[1]
-
-        sorted_sprites = sorted(self.game.sprites, key=square_distance, reverse=True)
+        rows, transformed_positions = self.project_sprites(surface)
 
         # determine surface centres on each axis
         screen_centre_x = surface.get_width() / 2
         screen_centre_y = surface.get_height() / 2
 
-        for sprite in sorted_sprites:
-            # find position of sprite with player as the origin
-            relative_position = sprite.position - self.game.player.position
-            # rotate sprite to camera space
-            transformed = np.matmul(self.game.player.inv_camera_matrix, relative_position)
+        atlas = self.game.data.atlas
+        self.update_atlas_pixels(surface)
+        pixels = pygame.surfarray.pixels2d(surface)
+
+        for row, transformed in zip(rows, transformed_positions):
+            sprite = self.game.entities.entities[row]
 
             for texture_data in sprite.textures:
                 if texture_data is None:
@@ -143,29 +325,37 @@ class GameRenderer:
                 screen_x = screen_centre_x * (1 + transformed[0] / transformed[1] * 2) - sprite_width / 2
                 screen_y = screen_centre_y - sprite_height / 2 + surface.get_height() * -sprite.height_offset / transformed[1]
 
-                if texture_data.simple_clip:
-                    flipped_texture = pygame.transform.flip(texture, texture_data.flip_x, False) if texture_data.flip_x else texture
-                    surface.blit(pygame.transform.scale(flipped_texture, (sprite_width, sprite_height)), (screen_x, screen_y))
-                else:
-                    # scale texture columns to the correct size
-                    scaled_texture_columns = list(map(lambda x: pygame.transform.scale(x, (1, sprite_height)), texture_data.columns))
-
-                    for x in range(sprite_width):
-                        column_screen_x = int(screen_x + x)
-                        # if:
-                        # 1. the distance to the sprite is not negative (i.e. it is in front of the camera)
-                        # 2. the texture column is on screen
-                        # 3. the texture column is in front of all walls
-                        if transformed[1] > 0 and \
-                                0 <= column_screen_x < self.z_buffer.shape[0] and \
-                                transformed[1] < self.z_buffer[column_screen_x]:
-                            index = int(x / sprite_width * texture.get_width())
-                            if texture_data.flip_x:
-                                index = -index
-                            surface.blit(scaled_texture_columns[index], (column_screen_x, screen_y))
+                # sample the texture straight out of the atlas for the columns that pass the z-buffer test
+                # (simple clip sprites are drawn whole, in front of walls)
+                draw_sprite_columns(pixels, self.z_buffer, self.atlas_pixels, self.atlas_opaque,
+                                    atlas.offsets[texture_data.atlas_index], texture.get_width(), texture.get_height(),
+                                    bool(texture_data.flip_x), screen_x, int(screen_y), sprite_width, sprite_height,
+                                    transformed[1], not texture_data.simple_clip)
+
+        del pixels
 
     def draw_floor(self, surface: Surface):
-        surface.fill(self.floor_colour, (0, surface.get_height() // 2, surface.get_width(), surface.get_height()))
+        layers = self.game.map_data.layers
+        if MapLayer.FLOOR not in layers:  # a plain floor
+            surface.fill(self.floor_colour, (0, surface.get_height() // 2, surface.get_width(), surface.get_height()))
+            if MapLayer.CEILING not in layers:
+                return
+
+        atlas = self.game.data.atlas
+        self.update_atlas_pixels(surface)
+        player = self.game.player
+        origin = self.game.map_data.to_local(player.position)  # the layers only hold the map's window
+
+        pixels = pygame.surfarray.pixels2d(surface)
+        if MapLayer.FLOOR in layers:
+            draw_plane_rows(pixels, origin, player.forward, player.camera_plane, layers[MapLayer.FLOOR],
+                            self.atlas_pixels, atlas.offsets, atlas.widths, atlas.heights, self.floor_texture_index,
+                            surface.map_rgb(self.floor_colour), False)
+        if MapLayer.CEILING in layers:  # cells without a ceiling texture show the sky
+            draw_plane_rows(pixels, origin, player.forward, player.camera_plane, layers[MapLayer.CEILING],
+                            self.atlas_pixels, atlas.offsets, atlas.widths, atlas.heights, self.ceiling_texture_index,
+                            -1, True)
+        del pixels
 
     def draw_sky(self, surface: Surface):
         sky_region = math.atan2(self.game.player.forward[1], self.game.player.forward[0]) / math.pi / 2
@@ -199,7 +389,7 @@ class GameRenderer:
         texture = player.weapon.get_texture().texture
         height = surface.get_height() * self.game.player.weapon.get_window_scale()
         width = height * texture.get_width() / texture.get_height()
-        scaled_texture = pygame.transform.scale(texture, (int(width), int(height)))
+        scaled_texture = scale_cache.scale(texture, (int(width), int(height)))
 
         screen_x = (surface.get_width() - scaled_texture.get_width()) // 2
         screen_y = surface.get_height() - scaled_texture.get_height()
@@ -215,12 +405,36 @@ class GameRenderer:
         scaled_crosshair = scale_by_height(self.crosshair_texture, int(surface.get_height() * GameRenderer.CROSSHAIR_SCALE))
         surface.blit(scaled_crosshair, ((surface.get_width() - scaled_crosshair.get_width()) // 2, (surface.get_height() - scaled_crosshair.get_height()) // 2))
 
+    def set_render_scale(self, render_scale: float):
+        self.render_scale = render_scale
+        self.resize_view()  # the screen's pixel format, font and HUD are unaffected
+
+    def get_view_surface(self, surface: Surface) -> Surface:
+        if self.render_size == surface.get_size():
+            return surface
+        if self.view_surface is None:
+            self.view_surface = Surface(self.render_size, 0, surface)
+        return self.view_surface
+
+    def draw_view(self, surface: Surface):
+        # draws the 3d view into the view buffer, then upscales it onto surface in one go
+        view = self.get_view_surface(surface)
+
+        self.draw_sky(view)
+        self.draw_floor(view)
+        self.draw_walls(view)
+        self.draw_sprites(view)
+        self.postprocess(view)
+
+        if view is not surface:
+            if self.smooth_upscale and surface.get_bitsize() >= 24:
+                pygame.transform.smoothscale(view, surface.get_size(), surface)
+            else:
+                pygame.transform.scale(view, surface.get_size(), surface)
+
     def draw(self, surface: Surface):
-        self.draw_floor(surface)
-        self.draw_sky(surface)
-        self.draw_walls(surface)
-        self.draw_sprites(surface)
-        self.postprocess(surface)
+        self.draw_view(surface)
+        # the weapon and hud are always drawn at the screen's resolution
         self.draw_weapon(surface)
         self.draw_hud(surface)
 
@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+from game_renderer import draw_plane_rows
+
+
+class DrawPlaneRowsTest(unittest.TestCase):
+    def setUp(self):
+        # a single 2x2 texture, texel (x, y) at x * 2 + y
+        self.atlas_pixels = np.array([10, 11, 12, 13], dtype=np.uint32)
+        self.texture_ids = np.ones((3, 3), dtype=np.uint8)
+        self.texture_ids[0, 2] = 0  # no texture
+        self.texture_index = np.full((256, ), -1, dtype=np.int32)
+        self.texture_index[1] = 0
+
+    def draw(self, fill_colour: int, ceiling: bool) -> np.ndarray:
+        pixels = np.zeros((4, 4), dtype=np.uint32)
+        # looking along +x from (1.5, 1.4), so the nearest row lands just inside the far column of the map and the row
+        # above it lands outside the map
+        draw_plane_rows(pixels, np.array([1.5, 1.4]), np.array([1.0, 0.0]), np.array([0.0, 1.0]), self.texture_ids,
+                        self.atlas_pixels, np.array([0], dtype=np.int64), np.array([2], dtype=np.int64),
+                        np.array([2], dtype=np.int64), self.texture_index, fill_colour, ceiling)
+        return pixels
+
+    def test_floor(self):
+        pixels = self.draw(99, False)
+        self.assertEqual(pixels[:, 3].tolist(), [99, 12, 12, 13])
+        self.assertEqual(pixels[:, 2].tolist(), [99, 99, 99, 99])  # outside the map
+        self.assertFalse(pixels[:, :2].any())  # above the horizon
+
+    def test_ceiling(self):
+        pixels = self.draw(-1, True)
+        self.assertEqual(pixels[:, 0].tolist(), [0, 12, 12, 13])  # cells without a texture are left alone
+        self.assertFalse(pixels[:, 1:].any())
+
+
+if __name__ == '__main__':
+    unittest.main()
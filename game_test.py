@@ -0,0 +1,22 @@
+import unittest
+import numpy as np
+from game import line_of_sight_batch
+
+
+class LineOfSightTest(unittest.TestCase):
+    def test_batch(self):
+        game_map = np.zeros((5, 5), dtype=np.uint8)
+        game_map[2, 1:4] = 1
+        origins = np.array([[0.5, 0.5], [4.5, 0.5], [2.5, 4.5], [0.5, 2.5]])
+        visible = line_of_sight_batch(origins, np.array([2.5, 0.5]), game_map)
+        self.assertEqual(visible.tolist(), [True, True, False, True])
+
+    def test_outside_map(self):
+        # everything outside the map is solid, so nothing outside it can see in
+        game_map = np.zeros((5, 5), dtype=np.uint8)
+        visible = line_of_sight_batch(np.array([[-3.5, 2.5], [8.5, 2.5]]), np.array([2.5, 2.5]), game_map)
+        self.assertEqual(visible.tolist(), [False, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@ CONFIG_PATH = "config.ini"
 TEXTURES_PATH = "textures"
 MAPS_PATH = "maps"
 SOUNDS_PATH = "sound"
+TEXTURE_CACHE_PATH = "cache"
 LOG_PATH = "log.txt"
 
 # from https://www.golinuxcloud.com/python-logging/
@@ -24,17 +25,22 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
+    config = DataManager.load_config(CONFIG_PATH)
+
+    # configure logging before assets start loading so that their load times are logged
+    logging.basicConfig(format=LOGGING_FORMAT,
+                        level=config.getint("Logging", "level"),
+                        filename=LOG_PATH)
+
     data_manager = DataManager(
         config_path=CONFIG_PATH,
         textures_path=TEXTURES_PATH,
         maps_path=MAPS_PATH,
         sounds_path=SOUNDS_PATH,
+        config=config,
+        texture_cache_path=TEXTURE_CACHE_PATH,
     )
 
-    logging.basicConfig(format=LOGGING_FORMAT,
-                        level=data_manager.config.getint("Logging", "level"),
-                        filename=LOG_PATH)
-
     game = RaycastingGame(data_manager)
 
     if args.debug:
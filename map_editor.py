@@ -4,7 +4,7 @@ import pygame
 from pygame import Surface
 from pygame.freetype import SysFont
 import numpy as np
-from game_map import Map, MapHelper
+from game_map import Map, MapHelper, MapAdjacency, flood_fill
 
 pygame.init()
 
@@ -13,6 +13,7 @@ class Editor:
     def __init__(self, width: int, height: int, path: str):
         self.path = path
         self.map: Map = np.zeros((width, height), dtype=np.uint8)
+        self.adjacency: MapAdjacency = MapAdjacency(self.map)
         self.selected_cell = np.zeros((2, ), dtype=int)
         self.running: bool = False
         self.stroke: int = 0
@@ -26,6 +27,7 @@ class Editor:
             pygame.K_MINUS: self.sub_stroke,
             pygame.K_RETURN: self.draw_stroke,
             pygame.K_f: self.fill,
+            pygame.K_b: self.bucket_fill,
         }
         self.cell_size: float = 0
 
@@ -56,10 +58,19 @@ class Editor:
             self.stroke = 255
 
     def draw_stroke(self):
-        self.map[self.selected_cell[0], self.selected_cell[1]] = self.stroke
+        self.adjacency.set_cell(self.selected_cell[0], self.selected_cell[1], self.stroke)
 
     def fill(self):
         self.map[:] = self.stroke
+        self.adjacency.reset()
+
+    def bucket_fill(self):
+        # fills the empty region connected to the selected cell
+        if self.map[self.selected_cell[0], self.selected_cell[1]] != 0:
+            return
+        region = flood_fill(self.selected_cell[0] * self.map.shape[1] + self.selected_cell[1], self.adjacency.masks)
+        self.map[region.reshape(self.map.shape)] = self.stroke
+        self.adjacency.reset()
 
     def validate_selected_cell(self):
         self.selected_cell[0] %= self.map.shape[0]
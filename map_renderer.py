@@ -1,5 +1,5 @@
 # project
-from game_map import Map, MapCell
+from game_map import Map, MapCell, ChunkedMap
 from player import Player
 from colour import ColourType
 from sprite import Sprite
@@ -14,8 +14,10 @@ import numpy as np
 class MapRenderer:
     BACKGROUND_COLOUR: ColourType = (255, 255, 255)
 
-    def __init__(self, game_map: Map, player: Player, sprites: list[Sprite]):
-        self.map: Map = game_map
+    def __init__(self, map_data: ChunkedMap, player: Player, sprites: list[Sprite]):
+        # only the window of the map around the player is drawn
+        self.map_data: ChunkedMap = map_data
+        self.map: Map = map_data.cells
         self.player: Player = player
         self.sprites: list[Sprite] = sprites
         self.map_colour_map: dict[MapCell, ColourType] = {
@@ -50,7 +52,7 @@ class MapRenderer:
                 pygame.draw.rect(surface, colour, rect)
 
         # draw player
-        player_position = self.player.position / self.map.shape[0] * surface.get_height() + centre_offset
+        player_position = self.map_data.to_local(self.player.position) / self.map.shape[0] * surface.get_height() + centre_offset
 
         pygame.draw.circle(surface, (0, 255, 0), player_position, 5)
         # TODO add more rays and use z-buffer to constrain them
@@ -60,4 +62,4 @@ class MapRenderer:
         # draw sprites
         for sprite in self.sprites:
             texture = sprite.textures[0].texture
-            surface.blit(texture, centre_offset + sprite.position * cell_width - (texture.get_width() / 2, texture.get_height() / 2))
+            surface.blit(texture, centre_offset + self.map_data.to_local(sprite.position) * cell_width - (texture.get_width() / 2, texture.get_height() / 2))
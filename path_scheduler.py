@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+# project
+from game_object import GameObject
+from game_map import MapAdjacency
+from vector import Vector2
+from utility import magnitude_2d
+# standard
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Union
+
+if TYPE_CHECKING:
+    from agent import Point
+
+
+class PathRequest:
+    def __init__(self, requester: GameObject, search: Callable[[], list[Point]], on_found: Callable[[list[Point]], None]):
+        self.requester: GameObject = requester
+        self.search: Callable[[], list[Point]] = search
+        self.on_found: Callable[[list[Point]], None] = on_found
+        self.cancelled: bool = False
+        self.done: bool = False
+        # the map revision and window origin the search ran against
+        self.revision: int = -1
+        self.origin: tuple[int, int] = (0, 0)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+# queues path searches and runs as many as fit in a per-frame time budget, leaving the rest for later frames
+# the budget is checked between searches; a single search is never split across frames
+# requests from objects closest to the focus (the player) are run first
+# at least one request is run every frame so that the queue always drains
+# with workers the searches run on a thread pool instead (the search kernels release the GIL) and finished results are
+# handed back to their requesters on the next update, so on_found is always called from the game thread
+# searches return paths in map coordinates; if the map changed or its window moved while a worker was searching, the
+# result is only thrown away (and the search run again) when its path now goes through a wall or out of the window
+class PathScheduler:
+    def __init__(self, budget: float, focus: Callable[[], Vector2], adjacency: MapAdjacency, workers: int = 0):
+        self.budget: float = budget  # seconds
+        self.focus: Callable[[], Vector2] = focus
+        self.adjacency: MapAdjacency = adjacency
+        self.pending: list[PathRequest] = []
+        self.running: list[tuple[PathRequest, Future[list[Point]]]] = []
+        self.executor: Union[ThreadPoolExecutor, None] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pathfinding") if workers > 0 else None
+        self.processed: int = 0  # number of requests run (or finished by a worker) on the last update
+
+    def submit(self, requester: GameObject, search: Callable[[], list[Point]], on_found: Callable[[list[Point]], None]) -> PathRequest:
+        request = PathRequest(requester, search, on_found)
+        self.pending.append(request)
+        return request
+
+    def clear(self):
+        for request in self.pending:
+            request.cancel()
+        for request, _ in self.running:
+            request.cancel()
+        self.pending = []
+        self.running = []
+
+    def shutdown(self):
+        self.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def run(self, request: PathRequest) -> list[Point]:
+        # anything that changes the map after this point also changes its revision
+        request.revision = self.adjacency.revision
+        request.origin = self.adjacency.origin
+        return request.search()
+
+    def is_current(self, request: PathRequest, path: list[Point]) -> bool:
+        if request.revision == self.adjacency.revision and request.origin == self.adjacency.origin:
+            return True
+        return self.adjacency.walkable(path)
+
+    def collect(self):
+        running = []
+        for request, future in self.running:
+            if not future.done():
+                running.append((request, future))
+            elif request.cancelled:
+                continue
+            elif not self.is_current(request, future.result()):  # search again against the map as it is now
+                self.pending.append(request)
+            else:
+                request.done = True
+                request.on_found(future.result())
+                self.processed += 1
+        self.running = running
+
+    def update(self):
+        self.processed = 0
+        self.collect()
+        self.pending = [request for request in self.pending if not request.cancelled]
+        if not self.pending:
+            return
+
+        # furthest first so that the closest request is popped off the end
+        focus = self.focus()
+        self.pending.sort(key=lambda request: magnitude_2d(request.requester.position - focus), reverse=True)
+
+        if self.executor is not None:
+            # the pool runs searches in the order they were submitted
+            while self.pending:
+                request = self.pending.pop()
+                self.running.append((request, self.executor.submit(self.run, request)))
+            return
+
+        start = time.perf_counter()
+        while self.pending:
+            request = self.pending.pop()
+            path = self.run(request)
+            request.done = True
+            request.on_found(path)
+            self.processed += 1
+            if time.perf_counter() - start >= self.budget:
+                break
@@ -0,0 +1,94 @@
+import unittest
+import numpy as np
+from path_scheduler import PathScheduler
+from game_map import MapAdjacency
+
+
+class Requester:
+    def __init__(self, x: float):
+        self.position = np.array([x, 0], dtype=float)
+
+
+class PathSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.found = []
+        self.adjacency = MapAdjacency(np.zeros((4, 4), dtype=np.uint8))
+        self.scheduler = PathScheduler(0, lambda: np.zeros((2, )), self.adjacency)
+
+    def submit(self, x: float):
+        return self.scheduler.submit(Requester(x), lambda: [(0, int(x))], self.found.append)
+
+    def test_closest_first(self):
+        for x in (5, 1, 3):
+            self.submit(x)
+        # a zero budget still runs one request per update
+        for _ in range(3):
+            self.scheduler.update()
+            self.assertEqual(self.scheduler.processed, 1)
+        self.assertEqual(self.found, [[(0, 1)], [(0, 3)], [(0, 5)]])
+
+    def test_budget(self):
+        self.scheduler.budget = 10
+        for x in range(4):
+            self.submit(x)
+        self.scheduler.update()
+        self.assertEqual(self.scheduler.processed, 4)
+        self.assertEqual(self.scheduler.pending, [])
+
+    def test_cancel(self):
+        request = self.submit(1)
+        self.submit(2)
+        request.cancel()
+        self.scheduler.update()
+        self.assertEqual(self.found, [[(0, 2)]])
+        self.assertFalse(request.done)
+
+    def test_workers(self):
+        scheduler = PathScheduler(0, lambda: np.zeros((2, )), self.adjacency, workers=2)
+        requests = [scheduler.submit(Requester(x), lambda x=x: [(0, x)], self.found.append) for x in range(4)]
+        scheduler.update()
+        self.assertEqual(self.found, [])  # results are only handed back on a later update
+        for _, future in scheduler.running:
+            future.result()
+        scheduler.update()
+        self.assertEqual(sorted(self.found), [[(0, x)] for x in range(4)])
+        self.assertTrue(all(request.done for request in requests))
+        scheduler.shutdown()
+
+    def run_worker_search(self, scheduler: PathScheduler, change_map):
+        self.found.clear()
+        request = scheduler.submit(Requester(1), lambda: [(0, 1), (0, 2)], self.found.append)
+        scheduler.update()
+        scheduler.running[0][1].result()
+        change_map()  # the map changes while the search is running
+        scheduler.update()
+        return request
+
+    def test_map_changed_during_search(self):
+        scheduler = PathScheduler(0, lambda: np.zeros((2, )), self.adjacency, workers=1)
+        # a change that doesn't touch the path keeps the result
+        self.run_worker_search(scheduler, lambda: self.adjacency.set_cell(3, 3, 1))
+        self.assertEqual(self.found, [[(0, 1), (0, 2)]])
+        # a wall on the path makes it search again
+        request = self.run_worker_search(scheduler, lambda: self.adjacency.set_cell(0, 2, 1))
+        self.assertEqual(self.found, [])
+        self.assertFalse(request.done)
+        scheduler.running[0][1].result()
+        scheduler.update()
+        self.assertEqual(self.found, [[(0, 1), (0, 2)]])  # the search is deterministic, so the result is accepted now
+        scheduler.shutdown()
+
+    def test_window_moved_during_search(self):
+        scheduler = PathScheduler(0, lambda: np.zeros((2, )), self.adjacency, workers=1)
+
+        def move_window():
+            self.adjacency.origin = (0, 2)
+            self.adjacency.reset()
+
+        # the path now starts outside the window
+        self.run_worker_search(scheduler, move_window)
+        self.assertEqual(self.found, [])
+        scheduler.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -45,12 +45,12 @@ class Rat(Agent):
         self.last_pathfinding_time = pygame.time.get_ticks()
 
     def set_random_goal(self):
-        self.follow_path(random_goal(vector_to_point(self.position), self.game.map))
+        self.request_path(lambda: random_goal(vector_to_point(self.position), self.game.components))
 
     def update(self, delta_time: float):
         super().update(delta_time)
 
-        if not self.pathfinding and pygame.time.get_ticks() - self.last_pathfinding_time > Rat.PATHFINDING_DELAY:
+        if not self.pathfinding and not self.path_pending and pygame.time.get_ticks() - self.last_pathfinding_time > Rat.PATHFINDING_DELAY:
             self.set_random_goal()
 
         if self.moving:  # if going somewhere
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+
+# picks the render scale of the 3d view so that drawing a frame takes about target seconds
+# draw times are smoothed, the scale is left alone for cooldown frames after each change and it is only raised when
+# the predicted draw time at the higher scale is still comfortably under target, so that it doesn't oscillate
+class ResolutionController:
+    def __init__(self, target: float, min_scale: float, max_scale: float, step: float = 0.1, tolerance: float = 0.15,
+                 smoothing: float = 0.1, cooldown: int = 30):
+        self.target: float = target  # seconds
+        self.min_scale: float = min_scale
+        self.max_scale: float = max_scale
+        self.step: float = step
+        self.tolerance: float = tolerance  # fraction of target the draw time may stray by before the scale changes
+        self.smoothing: float = smoothing  # weight of the newest draw time in the moving average
+        self.cooldown: int = cooldown
+        self.average: float = target
+        self.frames_since_change: int = 0
+
+    def update(self, draw_time: float, scale: float) -> float:
+        # returns the scale to draw the next frame at
+        self.average += (draw_time - self.average) * self.smoothing
+        self.frames_since_change += 1
+        if self.frames_since_change < self.cooldown:
+            return scale
+
+        new_scale = scale
+        if self.average > self.target * (1 + self.tolerance):
+            new_scale = max(round(scale - self.step, 2), self.min_scale)
+        elif scale < self.max_scale:
+            raised = min(round(scale + self.step, 2), self.max_scale)
+            # draw time grows with the number of pixels drawn
+            if self.average * (raised / scale) ** 2 < self.target * (1 - self.tolerance):
+                new_scale = raised
+
+        if new_scale != scale:
+            self.average *= (new_scale / scale) ** 2  # expected draw time at the new scale
+            self.frames_since_change = 0
+
+        return new_scale
@@ -0,0 +1,43 @@
+import unittest
+from resolution_controller import ResolutionController
+
+
+class ResolutionControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.controller = ResolutionController(0.016, 0.25, 1.0, cooldown=5)
+
+    def run_frames(self, scale: float, draw_time: float, frames: int) -> float:
+        for _ in range(frames):
+            scale = self.controller.update(draw_time, scale)
+        return scale
+
+    def test_lowers_scale_when_slow(self):
+        self.assertLess(self.run_frames(1.0, 0.032, 50), 1.0)
+
+    def test_clamps_to_min_scale(self):
+        self.assertEqual(self.run_frames(1.0, 1.0, 500), 0.25)
+
+    def test_raises_scale_when_fast(self):
+        self.assertEqual(self.run_frames(0.5, 0.001, 500), 1.0)
+
+    def test_holds_scale_near_target(self):
+        self.assertEqual(self.run_frames(0.8, 0.016, 500), 0.8)
+
+    def test_cooldown(self):
+        # nothing changes until cooldown frames have passed, however slow they are
+        self.assertEqual(self.run_frames(1.0, 1.0, 4), 1.0)
+        self.assertLess(self.run_frames(1.0, 1.0, 1), 1.0)
+
+    def test_settles(self):
+        # draw time proportional to pixel count; the scale should settle instead of oscillating
+        scale = 1.0
+        history = []
+        for _ in range(2000):
+            scale = self.controller.update(0.03 * scale ** 2, scale)
+            history.append(scale)
+        self.assertEqual(len(set(history[-500:])), 1)
+        self.assertLessEqual(0.03 * history[-1] ** 2, 0.016 * 1.15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,14 +39,11 @@ class Skeleton(Enemy):
     def update(self, delta_time: float):
         super().update(delta_time)
 
-        player_relative_position = self.game.player.position - self.position
-        player_distance = magnitude_2d(player_relative_position)
+        player_distance = magnitude_2d(self.game.player.position - self.position)
 
-        info = self.game.raycast(self.position, player_relative_position / player_distance, player_distance)
-
-        if info.hit:  # can't see player
+        if not self.sees_player:  # can't see player
             if not self.pathfinding:
-                self.follow_path_to(self.game.player.position)
+                self.follow_flow_field(self.game.flow_field)
         else:  # can see player
             self.go_to(self.game.player.position.copy())  # move directly to the player
             self.pathfinding = False
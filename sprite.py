@@ -1,16 +1,22 @@
 from vector import Vector2
 from texture import TextureData
+from entity_store import Entity, EntityField
 from typing import Union
 
 
-class Sprite:
+class Sprite(Entity):
+    position: Vector2 = EntityField()
+    scale: float = EntityField()
+    height_offset: float = EntityField()
+
     def __init__(self, position: Vector2, textures: list[Union[TextureData, None]] = None, scale: float = 1, height_offset: float = 0):
-        self.position: Vector2 = position
+        super().__init__()
+        self.position = position
         if textures is None:
             textures = []
         self.textures: list[Union[TextureData, None]] = textures
-        self.scale: float = scale
-        self.height_offset: float = height_offset
+        self.scale = scale
+        self.height_offset = height_offset
 
     @staticmethod
     def get_height_offset(scale: float) -> float:
@@ -1,24 +1,145 @@
 from __future__ import annotations
 
-from pygame import Surface, PixelArray
+from pygame import Surface
+import pygame
+# numpy
+import numpy as np
+from numpy_typing import NDArray
+# standard
+import threading
 
 
 Texture = Surface
+TexturePixels = NDArray[np.uint32]
 empty_surface = Surface((0, 0))
 
 
+def texture_to_pixels(texture: Texture) -> TexturePixels:
+    # returns the texture's pixels as 0xAARRGGBB indexed [x, y] (so each column is contiguous)
+    rgb = pygame.surfarray.array3d(texture).astype(np.uint32)
+    alpha = pygame.surfarray.array_alpha(texture).astype(np.uint32)
+    return np.ascontiguousarray(alpha << 24 | rgb[:, :, 0] << 16 | rgb[:, :, 1] << 8 | rgb[:, :, 2])
+
+
+def map_pixels(pixels: TexturePixels, surface: Surface) -> TexturePixels:
+    # maps 0xAARRGGBB pixels into the pixel format of surface so that they can be written straight into a pixels2d
+    # view of it
+    mapped = np.zeros(pixels.shape, dtype=np.uint32)
+    for channel_shift, mask, shift, loss in zip((16, 8, 0, 24), surface.get_masks(), surface.get_shifts(), surface.get_losses()):
+        if mask != 0:
+            mapped |= ((pixels >> channel_shift & 0xFF) >> loss) << shift
+    return mapped
+
+
+def pixels_to_texture(pixels: TexturePixels) -> Texture:
+    # builds a texture from 0xAARRGGBB pixels indexed [x, y] without going through an image decoder
+    texture = Surface(pixels.shape, pygame.SRCALPHA, 32)
+    view = pygame.surfarray.pixels2d(texture)
+    view[:] = map_pixels(pixels, texture)
+    del view  # unlock the surface
+    return texture
+
+
+# stores the pixels of many textures in one contiguous column-major buffer of 0xAARRGGBB values
+# column x of texture i occupies pixels[offsets[i] + x * heights[i]:offsets[i] + (x + 1) * heights[i]]
+class TextureAtlas:
+    def __init__(self, capacity: int = 0, texture_capacity: int = 0):
+        self.pixels: TexturePixels = np.zeros((capacity, ), dtype=np.uint32)
+        self.offsets: NDArray[np.int64] = np.zeros((texture_capacity, ), dtype=np.int64)
+        self.widths: NDArray[np.int64] = np.zeros((texture_capacity, ), dtype=np.int64)
+        self.heights: NDArray[np.int64] = np.zeros((texture_capacity, ), dtype=np.int64)
+        self.size: int = 0  # number of pixels in use
+        self.count: int = 0  # number of textures stored
+        self.lock: threading.Lock = threading.Lock()  # textures may be added from loader threads
+
+    @staticmethod
+    def grow(array: NDArray, minimum: int) -> NDArray:
+        grown = np.zeros((max(minimum, 2 * array.shape[0]), ), dtype=array.dtype)
+        grown[:array.shape[0]] = array
+        return grown
+
+    def add(self, texture: Texture) -> int:
+        return self.add_pixels(texture_to_pixels(texture))
+
+    def add_pixels(self, pixels: TexturePixels) -> int:
+        with self.lock:
+            return self._add_pixels(pixels)
+
+    def _add_pixels(self, pixels: TexturePixels) -> int:
+        width, height = pixels.shape
+
+        # grow storage geometrically so that adding textures one by one stays cheap
+        if self.size + pixels.size > self.pixels.shape[0]:
+            self.pixels = TextureAtlas.grow(self.pixels, self.size + pixels.size)
+        if self.count == self.offsets.shape[0]:
+            self.offsets = TextureAtlas.grow(self.offsets, self.count + 1)
+            self.widths = TextureAtlas.grow(self.widths, self.count + 1)
+            self.heights = TextureAtlas.grow(self.heights, self.count + 1)
+
+        index = self.count
+        self.pixels[self.size:self.size + pixels.size] = pixels.ravel()
+        self.offsets[index] = self.size
+        self.widths[index] = width
+        self.heights[index] = height
+        self.size += pixels.size
+        self.count += 1
+
+        return index
+
+    def column(self, index: int, x: int) -> TexturePixels:
+        start = self.offsets[index] + x * self.heights[index]
+        return self.pixels[start:start + self.heights[index]]
+
+    def texture_pixels(self, index: int) -> TexturePixels:
+        start = self.offsets[index]
+        return self.pixels[start:start + self.widths[index] * self.heights[index]].reshape((self.widths[index], self.heights[index]))
+
+    def mapped(self, surface: Surface) -> TexturePixels:
+        # returns a copy of the atlas with every pixel mapped into the pixel format of surface
+        with self.lock:
+            pixels = self.pixels[:self.size]
+        return map_pixels(pixels, surface)
+
+    def opaque(self) -> NDArray[np.bool_]:
+        # which pixels of the atlas are opaque (sprite textures only use fully opaque or fully transparent pixels)
+        with self.lock:
+            pixels = self.pixels[:self.size]
+        return pixels >> 24 >= 128
+
+    @staticmethod
+    def from_buffer(pixels: TexturePixels, offsets: NDArray[np.int64], widths: NDArray[np.int64], heights: NDArray[np.int64]) -> TextureAtlas:
+        # wraps an existing (e.g. memory-mapped) buffer without copying it
+        atlas = TextureAtlas()
+        atlas.pixels = pixels
+        atlas.offsets = offsets
+        atlas.widths = widths
+        atlas.heights = heights
+        atlas.size = pixels.shape[0]
+        atlas.count = offsets.shape[0]
+        return atlas
+
+    @staticmethod
+    def from_textures(textures: list[Texture]) -> tuple[TextureAtlas, list[int]]:
+        # allocate the whole buffer up front
+        atlas = TextureAtlas(sum(texture.get_width() * texture.get_height() for texture in textures), len(textures))
+        return atlas, [atlas.add(texture) for texture in textures]
+
+
 class TextureData:
-    def __init__(self, texture: Texture, columns: list[Texture], flip_x: bool = False, simple_clip: bool = False):
+    def __init__(self, texture: Texture, atlas: TextureAtlas, atlas_index: int, flip_x: bool = False, simple_clip: bool = False):
         self.texture: Texture = texture
-        self.columns: list[Texture] = columns
+        self.atlas: TextureAtlas = atlas
+        self.atlas_index: int = atlas_index
         self.flip_x: bool = flip_x
         self.simple_clip: bool = simple_clip
 
-    @staticmethod
-    def texture_to_columns(texture: Texture) -> list[Texture]:
-        pixel_array = PixelArray(texture).transpose()
-        return [pixel_array[:, col].transpose().make_surface() for col in range(pixel_array.shape[1])]
+    @property
+    def pixels(self) -> TexturePixels:
+        return self.atlas.texture_pixels(self.atlas_index)
+
+    def column(self, x: int) -> TexturePixels:
+        return self.atlas.column(self.atlas_index, x)
 
     @staticmethod
-    def from_texture(texture: Texture) -> TextureData:
-        return TextureData(texture, TextureData.texture_to_columns(texture))
+    def from_texture(texture: Texture, atlas: TextureAtlas) -> TextureData:
+        return TextureData(texture, atlas, atlas.add(texture))
@@ -0,0 +1,27 @@
+import unittest
+import numpy as np
+from pygame import Surface, SRCALPHA
+from texture import TextureAtlas
+
+
+class TextureAtlasTest(unittest.TestCase):
+    def test_columns(self):
+        texture = Surface((2, 3), SRCALPHA)
+        texture.fill((0, 0, 0, 0))
+        texture.set_at((1, 2), (1, 2, 3, 255))
+        atlas, (first, second) = TextureAtlas.from_textures([Surface((4, 4)), texture])
+        self.assertEqual(atlas.size, 22)
+        self.assertEqual(atlas.texture_pixels(second).shape, (2, 3))
+        self.assertTrue(np.array_equal(atlas.column(second, 0), [0, 0, 0]))
+        self.assertTrue(np.array_equal(atlas.column(second, 1), [0, 0, 0xFF010203]))
+
+    def test_grow(self):
+        atlas = TextureAtlas()
+        for i in range(5):
+            self.assertEqual(atlas.add(Surface((i + 1, 2))), i)
+        self.assertEqual(atlas.size, 30)
+        self.assertEqual(atlas.offsets[4], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import numpy as np
 from vector import Vector2
 from texture import Texture
 import pygame
+from collections import OrderedDict
 
 
 def angle_between_vectors(a: Vector2, b: Vector2):
@@ -21,6 +22,52 @@ def magnitude_2d(vector2: Vector2) -> float:
     return np.sqrt(vector2[0] * vector2[0] + vector2[1] * vector2[1])  # faster than np.linalg.norm(x) or np.sqrt(x.dot(x))
 
 
+# remembers scaled (and flipped) copies of textures so that textures drawn at the same size every frame are only scaled
+# once, evicting the least recently used copies once they take up more than max_bytes
+# the returned textures are shared, so callers must copy them before drawing onto them
+class ScaleCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes: int = max_bytes
+        # values keep a reference to the source texture so that its id can't be reused while it is cached
+        self.entries: OrderedDict[tuple[int, tuple[int, int], bool, bool], tuple[Texture, Texture]] = OrderedDict()
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def scale(self, texture: Texture, size: tuple[int, int], flip_x: bool = False, flip_y: bool = False) -> Texture:
+        key = (id(texture), size, flip_x, flip_y)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        flipped = pygame.transform.flip(texture, flip_x, flip_y) if flip_x or flip_y else texture
+        scaled = pygame.transform.scale(flipped, size)
+        self.entries[key] = (texture, scaled)
+        self.bytes += ScaleCache.texture_bytes(scaled)
+
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= ScaleCache.texture_bytes(evicted)
+            self.evictions += 1
+
+        return scaled
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    @staticmethod
+    def texture_bytes(texture: Texture) -> int:
+        return texture.get_width() * texture.get_height() * texture.get_bytesize()
+
+
+scale_cache = ScaleCache()
+
+
 def scale_by_height(texture: Texture, height: int) -> Texture:
     width = height * texture.get_width() // texture.get_height()
-    return pygame.transform.scale(texture, (width, height))
+    return scale_cache.scale(texture, (width, height))
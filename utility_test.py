@@ -1,6 +1,7 @@
 import unittest
-from utility import angle_between_vectors
+from utility import angle_between_vectors, ScaleCache
 import numpy as np
+import pygame
 
 
 class UtilityTest(unittest.TestCase):
@@ -11,5 +12,26 @@ class UtilityTest(unittest.TestCase):
         self.assertEqual(angle_between_vectors(np.array([1, 0]), np.array([0, -1])), np.radians(90))
 
 
+class ScaleCacheTest(unittest.TestCase):
+    def test_hit(self):
+        cache = ScaleCache()
+        texture = pygame.Surface((4, 2))
+        scaled = cache.scale(texture, (8, 4))
+        self.assertIs(cache.scale(texture, (8, 4)), scaled)
+        self.assertIsNot(cache.scale(texture, (8, 4), flip_x=True), scaled)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_eviction(self):
+        texture = pygame.Surface((1, 1), 0, 32)
+        cache = ScaleCache(max_bytes=3 * 16 * 16 * 4)
+        first = cache.scale(texture, (16, 16))
+        cache.scale(texture, (16, 17))
+        cache.scale(texture, (16, 16))  # the first size is now the most recently used
+        cache.scale(texture, (16, 18))
+        self.assertEqual(cache.evictions, 1)
+        self.assertIs(cache.scale(texture, (16, 16)), first)
+        self.assertLessEqual(cache.bytes, cache.max_bytes)
+
+
 if __name__ == '__main__':
     unittest.main()